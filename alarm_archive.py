@@ -0,0 +1,169 @@
+import gzip
+import json
+import os
+import re
+
+
+SEGMENT_PATTERN = re.compile(r'^alarms-(\d{4}-\d{2}-\d{2})-(\d+)-(\d+)-(\d+)\.jsonl\.gz$')
+UNDATED = '0000-00-00'
+
+
+def _number(alarm):
+    return int(alarm['id'].split('_')[1])
+
+
+class AlarmArchive:
+    # One gzip JSON-lines file per (date, archive run). The date and id range are
+    # in the file name, so queries skip segments without opening them.
+    def __init__(self, directory):
+        self.directory = directory
+        self.segments = []
+        self.load()
+    
+    def load(self):
+        segments = []
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            names = []
+        
+        for name in names:
+            path = os.path.join(self.directory, name)
+            if name.endswith('.tmp'):
+                os.remove(path)
+                continue
+            
+            match = SEGMENT_PATTERN.match(name)
+            if match is None:
+                continue
+            segments.append({
+                'date': match.group(1),
+                'first': int(match.group(2)),
+                'last': int(match.group(3)),
+                'count': int(match.group(4)),
+                'path': path
+            })
+        
+        segments.sort(key=lambda segment: segment['first'])
+        self.segments = segments
+        if segments:
+            print(f'Found {len(segments)} alarm archive segments ({self.count} alarms) in {self.directory}')
+    
+    @property
+    def count(self):
+        return sum(segment['count'] for segment in self.segments)
+    
+    def write(self, alarms):
+        os.makedirs(self.directory, exist_ok=True)
+        
+        partitions = {}
+        for alarm in alarms:
+            date = alarm.get('timestamp', '')[:10] or UNDATED
+            partitions.setdefault(date, []).append(alarm)
+        
+        for date, group in sorted(partitions.items()):
+            group.sort(key=_number)
+            first = _number(group[0])
+            last = _number(group[-1])
+            path = os.path.join(self.directory, f'alarms-{date}-{first:010d}-{last:010d}-{len(group)}.jsonl.gz')
+            tmp_path = path + '.tmp'
+            
+            data = ''.join(json.dumps(alarm, separators=(',', ':')) + '\n' for alarm in group).encode('utf-8')
+            with open(tmp_path, 'wb') as f:
+                with gzip.GzipFile(fileobj=f, mode='wb', compresslevel=6) as compressed:
+                    compressed.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            
+            segments = [segment for segment in self.segments if segment['path'] != path]
+            segments.append({'date': date, 'first': first, 'last': last, 'count': len(group), 'path': path})
+            segments.sort(key=lambda segment: segment['first'])
+            self.segments = segments
+    
+    def clear(self):
+        for segment in self.segments:
+            try:
+                os.remove(segment['path'])
+            except FileNotFoundError:
+                pass
+        self.segments = []
+    
+    def _read(self, segment):
+        try:
+            with gzip.open(segment['path'], 'rt', encoding='utf-8') as f:
+                for line in f:
+                    yield json.loads(line)
+        except FileNotFoundError:
+            return
+        except (OSError, EOFError, ValueError) as e:
+            print(f"Failed to read alarm archive segment {segment['path']}: {e}")
+    
+    def query(self, status=None, lane=None, alarm_type=None, vehicle_type=None,
+              since=None, until=None, after_id=None, before_id=None,
+              limit=None, descending=False):
+        filters = {
+            'status': status,
+            'lane': lane.upper() if lane else None,
+            'type': alarm_type,
+            'vehicle_type': vehicle_type
+        }
+        filters = {field: value for field, value in filters.items() if value is not None}
+        
+        segments = []
+        for segment in self.segments:
+            if (since is not None and segment['date'] != UNDATED and segment['date'] < since[:10]) or \
+               (until is not None and segment['date'] > until[:10]):
+                continue
+            if (after_id is not None and segment['last'] <= after_id) or \
+               (before_id is not None and segment['first'] >= before_id):
+                continue
+            segments.append(segment)
+        segments.sort(key=lambda segment: segment['last'] if descending else segment['first'], reverse=descending)
+        
+        results = []
+        for segment in segments:
+            if limit is not None and len(results) >= limit:
+                results.sort(key=_number, reverse=descending)
+                del results[limit:]
+                edge = _number(results[-1])
+                if (descending and segment['last'] < edge) or (not descending and segment['first'] > edge):
+                    break
+            
+            for alarm in self._read(segment):
+                number = _number(alarm)
+                if (after_id is not None and number <= after_id) or \
+                   (before_id is not None and number >= before_id):
+                    continue
+                if any(alarm.get(field) != value for field, value in filters.items()):
+                    continue
+                
+                timestamp = alarm.get('timestamp', '')
+                if (since is not None and timestamp < since) or \
+                   (until is not None and timestamp > until):
+                    continue
+                
+                results.append(alarm)
+        
+        results.sort(key=_number, reverse=descending)
+        return results[:limit] if limit is not None else results
+
+
+class NullAlarmArchive:
+    # stands in for the archive when alarms are kept in memory only; nothing on
+    # disk is listed, written or removed
+    directory = None
+    segments = []
+    count = 0
+    
+    def load(self):
+        pass
+    
+    def write(self, alarms):
+        pass
+    
+    def clear(self):
+        pass
+    
+    def query(self, **query):
+        return []
@@ -1,16 +1,42 @@
+import os
+import time
+
+# the startup report measures from here, so it includes module imports
+PROCESS_STARTED = time.perf_counter()
+
+# 'gevent' multiplexes streaming viewers and Socket.IO clients on green threads;
+# patching has to happen before anything else imports socket or threading
+SERVER_MODE = os.environ.get('SERVER_MODE', 'threading')
+if SERVER_MODE == 'gevent' and __name__ != '__mp_main__':
+    from gevent import monkey
+    monkey.patch_all()
+    import gevent
+
 from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
-from flask_socketio import SocketIO, emit
-from PIL import Image, ImageDraw, ImageFont
+from flask_socketio import SocketIO, emit, join_room, leave_room
+from werkzeug.wsgi import wrap_file
 import threading
-import time
-import os
 import json
-from datetime import datetime
+import math
+from datetime import datetime, timedelta
 import io
-import cv2
+import hashlib
+import tempfile
+import bisect
+import sqlite3
+import re
+import itertools
+import contextlib
+from collections import deque
+import multiprocessing
 import random
 import numpy as np
+from metrics import Histogram, LabeledCounter, MetricsWriter, LATENCY_BUCKETS, TICK_BUCKETS, CONTENT_TYPE
+from alarm_archive import AlarmArchive, NullAlarmArchive
+from timeseries import TrafficHistory, DEFAULT_HISTORY_POINTS
+from thresholds import THRESHOLD_LANES, VEHICLE_TYPES, compile_thresholds, new_violation_times
+from tracking import DEFAULT_COUNTING_LINES, validate_counting_lines
 
 
 app = Flask(__name__)
@@ -25,14 +51,73 @@ CORS(app, resources={
     r"/processed_feed": {"origins": "*"}
 })
 
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
+socket_emits = LabeledCounter()
+
+
+class InstrumentedSocketIO(SocketIO):
+    # handler-level emit() also ends up here, so this counts every event sent
+    def emit(self, event, *args, **kwargs):
+        socket_emits.inc(event)
+        return super().emit(event, *args, **kwargs)
+
+
+socketio = InstrumentedSocketIO(
+    app,
+    cors_allowed_origins="*",
+    async_mode='gevent' if SERVER_MODE == 'gevent' else 'threading'
+)
 
 ALLOWED_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv', 'webm'}
 MAX_FILE_SIZE = 500 * 1024 * 1024
 app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
 
-current_video_data = None
-current_video_mimetype = 'video/mp4'
+VIDEO_CHUNK_SIZE = 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_BYTE_RANGES = 16
+MAX_ALARM_PAGE_SIZE = 1000
+
+MAX_WINDOW_MINUTES = 120
+
+# /processed_feed variants: ?width=&quality=&fps=
+DEFAULT_JPEG_QUALITY = 85
+MIN_JPEG_QUALITY = 10
+MAX_JPEG_QUALITY = 95
+MIN_VARIANT_WIDTH = 64
+MAX_VARIANT_WIDTH = 3840
+MIN_VARIANT_FPS = 0.2
+MAX_VARIANT_FPS = 60
+MAX_FRAME_VARIANTS = int(os.environ.get('MAX_FRAME_VARIANTS', 8))
+
+DEFAULT_STREAM_ID = 'default'
+STREAM_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+MAX_STREAMS = int(os.environ.get('MAX_STREAMS', 32))
+MAX_CONCURRENT_DECODERS = int(os.environ.get('MAX_CONCURRENT_DECODERS', os.cpu_count() or 4))
+# under gevent the decode/annotate threads would be green and stall the hub, so
+# the pipeline defaults to a worker process there
+VIDEO_PROCESS_MODE = os.environ.get('VIDEO_PROCESS_MODE', 'process' if SERVER_MODE == 'gevent' else 'thread')
+# 'motion' counts vehicles from background subtraction, 'dummy' keeps the simulated boxes and counts
+DETECTION_MODE = os.environ.get('DETECTION_MODE', 'motion')
+
+ALARM_STORAGE_BACKEND = os.environ.get('ALARM_STORAGE_BACKEND', 'json')
+ALARM_DATABASE_FILE = os.environ.get('ALARM_DATABASE_FILE', 'alarm_history.db')
+# alarm_added notifications are coalesced into alarms_batch events
+ALARM_BATCH_WINDOW = float(os.environ.get('ALARM_BATCH_WINDOW', 0.25))
+ALARM_CLIENT_MIN_INTERVAL = float(os.environ.get('ALARM_CLIENT_MIN_INTERVAL', 1.0))
+ALARM_QUEUE_LIMIT = int(os.environ.get('ALARM_QUEUE_LIMIT', 1000))
+# cleared alarms older than the retention period, or beyond the hot limit, move
+# from memory into compressed archive segments; <= 0 hours keeps everything hot
+ALARM_ARCHIVE_DIR = os.environ.get('ALARM_ARCHIVE_DIR', 'alarm_archive')
+ALARM_RETENTION_HOURS = float(os.environ.get('ALARM_RETENTION_HOURS', 24))
+ALARM_HOT_CLEARED_LIMIT = int(os.environ.get('ALARM_HOT_CLEARED_LIMIT', 10000))
+ALARM_RETENTION_CHECK_SECONDS = float(os.environ.get('ALARM_RETENTION_CHECK_SECONDS', 60))
+# a failing alarm history load is retried with doubling delays, then alarms are
+# kept in memory only so the rest of the server keeps working
+ALARM_LOAD_ATTEMPTS = int(os.environ.get('ALARM_LOAD_ATTEMPTS', 4))
+ALARM_LOAD_RETRY_SECONDS = float(os.environ.get('ALARM_LOAD_RETRY_SECONDS', 1.0))
+# per-stream count history is kept in fixed ring buffers; set a flush interval to
+# also persist it to TRAFFIC_HISTORY_DIR and restore it on restart
+TRAFFIC_HISTORY_DIR = os.environ.get('TRAFFIC_HISTORY_DIR', 'traffic_history')
+TRAFFIC_HISTORY_FLUSH_SECONDS = float(os.environ.get('TRAFFIC_HISTORY_FLUSH_SECONDS', 0))
 backend_polling_rate = 5
 polling_rate_lock = threading.Lock()
 
@@ -52,22 +137,69 @@ DEFAULT_THRESHOLDS = {
 }
 
 current_thresholds = DEFAULT_THRESHOLDS.copy()
+threshold_table = compile_thresholds(current_thresholds)
 THRESHOLDS_FILE = 'thresholds.json'
 
-print("Server started")
+# importing this module only defines things; create_app() brings the server up.
+# Spawned video workers re-import it as __mp_main__ and so start nothing.
+alarm_manager = None
+alarms_ready = threading.Event()
+stream_registry = None
+default_stream = None
+traffic_data = None
+stats_broadcaster = None
+data_thread = None
+
+
+def run_blocking(func, *args):
+    # CPU-bound calls go to gevent's native thread pool so other greenlets keep running
+    if SERVER_MODE == 'gevent':
+        return gevent.get_hub().threadpool.apply(func, args)
+    return func(*args)
+
+
+def alarm_number(alarm_id):
+    return int(str(alarm_id).rsplit('_', 1)[-1])
 
 
 class AlarmManager:
+    INDEXED_FIELDS = ('status', 'lane', 'type', 'vehicle_type')
+    
     def __init__(self):
-        self.alarms = []
+        self.alarms = {}
+        self.indexes = {field: {} for field in self.INDEXED_FIELDS}
+        self.unsorted_buckets = set()
+        self.alarm_numbers = []
+        self.version = 0
+        self.instance_token = os.urandom(4).hex()
         self.alarm_id_counter = 1
         self.alarm_history_file = 'alarm_history.json'
+        self.alarm_journal_file = 'alarm_history.journal'
+        self.JOURNAL_COMPACT_EVERY = 1000
+        # compact once the journal reaches this fraction of the snapshot, so the
+        # snapshot rewrite cost stays amortised O(1) per event as the store grows
+        self.JOURNAL_COMPACT_RATIO = 0.5
+        self.journal_seq = 0
+        self.journal_events = 0
+        self.journal = None
         self.lock = threading.Lock()
+        self.archive = self._open_archive()
+        self.ARCHIVE_BATCH_SIZE = 5000
+        self.retention_thread = None
+        
+        # observed while holding self.lock, which already serialises the writers
+        self.add_latency = Histogram(LATENCY_BUCKETS)
+        self.lock_wait = Histogram(LATENCY_BUCKETS)
+        self.save_latency = Histogram(LATENCY_BUCKETS)
+        
         self.load_alarms()
         
-        if len(self.alarms) == 0:
+        if self.get_total_count() == 0:
             self._generate_dummy_alarms()
     
+    def _open_archive(self):
+        return AlarmArchive(ALARM_ARCHIVE_DIR)
+    
     def _generate_dummy_alarms(self):
         dummy_alarms = [
             {
@@ -112,7 +244,9 @@ class AlarmManager:
     def add_alarm(self, alarm_type, lane, vehicle_type=None, speed=None, 
                   duration=None, count=None, max_count=None, message=None, 
                   details=None, **kwargs):
+        wait_start = time.perf_counter()
         with self.lock:
+            acquired = time.perf_counter()
             alarm = {
                 'id': f'alarm_{self.alarm_id_counter}',
                 'type': alarm_type,
@@ -136,56 +270,233 @@ class AlarmManager:
             
             alarm.update(kwargs)
             
-            self.alarms.append(alarm)
+            self._insert_alarm(alarm)
             self.alarm_id_counter += 1
-            self.save_alarms()
+            self._append_journal({'op': 'add', 'alarm': alarm})
             
-            try:
-                socketio.emit('alarm_added', alarm)
-            except:
-                pass
+            alarm_broadcaster.publish(alarm)
             
             print(f"Alarm added: {alarm_type} - {alarm.get('message', 'No message')}")
+            
+            self.lock_wait.observe(acquired - wait_start)
+            self.add_latency.observe(time.perf_counter() - wait_start)
             return alarm
     
+    def _insert_alarm(self, alarm):
+        self.alarms[alarm['id']] = alarm
+        for field in self.INDEXED_FIELDS:
+            self._index_alarm(field, alarm)
+        
+        number = alarm_number(alarm['id'])
+        if not self.alarm_numbers or number > self.alarm_numbers[-1]:
+            self.alarm_numbers.append(number)
+        else:
+            bisect.insort(self.alarm_numbers, number)
+        self.version += 1
+    
+    def _remove_alarm(self, alarm_id):
+        alarm = self.alarms.pop(alarm_id, None)
+        if alarm is None:
+            return None
+        
+        number = alarm_number(alarm_id)
+        position = bisect.bisect_left(self.alarm_numbers, number)
+        if position < len(self.alarm_numbers) and self.alarm_numbers[position] == number:
+            del self.alarm_numbers[position]
+        self.version += 1
+        
+        self._unindex_alarm(alarm)
+        return alarm
+    
+    def _remove_alarms(self, alarm_ids):
+        removed = set()
+        for alarm_id in alarm_ids:
+            alarm = self.alarms.pop(alarm_id, None)
+            if alarm is not None:
+                self._unindex_alarm(alarm)
+                removed.add(alarm_number(alarm_id))
+        
+        # one pass over the sorted ids instead of a list deletion per alarm
+        if removed:
+            self.alarm_numbers = [number for number in self.alarm_numbers if number not in removed]
+            self.version += 1
+        return len(removed)
+    
+    def _unindex_alarm(self, alarm):
+        for field in self.INDEXED_FIELDS:
+            bucket = self.indexes[field].get(alarm.get(field))
+            if bucket is not None:
+                bucket.pop(alarm['id'], None)
+                if not bucket:
+                    del self.indexes[field][alarm.get(field)]
+    
+    def _set_status(self, alarm, status):
+        status_index = self.indexes['status']
+        old_bucket = status_index.get(alarm.get('status'))
+        if old_bucket is not None:
+            old_bucket.pop(alarm['id'], None)
+            if not old_bucket:
+                del status_index[alarm.get('status')]
+        
+        alarm['status'] = status
+        self._index_alarm('status', alarm)
+        self.version += 1
+    
+    def _index_alarm(self, field, alarm):
+        value = alarm.get(field)
+        bucket = self.indexes[field].setdefault(value, {})
+        # buckets are walked in id order by query_alarms; an out-of-order add
+        # (clearing an older alarm, journal replay) marks the bucket for a re-sort
+        if bucket and alarm_number(next(reversed(bucket))) > alarm_number(alarm['id']):
+            self.unsorted_buckets.add((field, value))
+        bucket[alarm['id']] = alarm
+    
+    def _sorted_bucket(self, field, value):
+        bucket = self.indexes[field].get(value, {})
+        if (field, value) in self.unsorted_buckets:
+            self.unsorted_buckets.discard((field, value))
+            if bucket:
+                bucket = dict(sorted(bucket.items(), key=lambda item: alarm_number(item[0])))
+                self.indexes[field][value] = bucket
+        return bucket
+    
+    def _reset_store(self):
+        self.alarms = {}
+        self.indexes = {field: {} for field in self.INDEXED_FIELDS}
+        self.unsorted_buckets = set()
+        self.alarm_numbers = []
+        self.alarm_id_counter = 1
+        self.version += 1
+    
     def get_all_alarms(self):
         with self.lock:
-            return self.alarms.copy()
+            return list(self.alarms.values())
+    
+    def get_alarm(self, alarm_id):
+        with self.lock:
+            return self.alarms.get(alarm_id)
     
     def get_active_alarms(self):
         with self.lock:
-            return [alarm for alarm in self.alarms if alarm.get('status') == 'active']
+            return list(self.indexes['status'].get('active', {}).values())
     
     def get_active_count(self):
-        return len(self.get_active_alarms())
+        with self.lock:
+            return len(self.indexes['status'].get('active', {}))
+    
+    def get_total_count(self):
+        with self.lock:
+            return len(self.alarms)
+    
+    def get_counts_by(self, field):
+        with self.lock:
+            return {value: len(bucket) for value, bucket in self.indexes[field].items()}
+    
+    def get_latest_id(self):
+        with self.lock:
+            if not self.alarm_numbers:
+                return None
+            return f'alarm_{self.alarm_numbers[-1]}'
+    
+    def get_etag(self, query=b''):
+        with self.lock:
+            version = self.version
+        return hashlib.sha1(f'{self.instance_token}:{version}:'.encode() + query).hexdigest()
+    
+    def query_alarms(self, status=None, lane=None, alarm_type=None, vehicle_type=None,
+                     since=None, until=None, after_id=None, before_id=None,
+                     limit=None, descending=False):
+        filters = {
+            'status': status,
+            'lane': lane.upper() if lane else None,
+            'type': alarm_type,
+            'vehicle_type': vehicle_type
+        }
+        filters = {field: value for field, value in filters.items() if value is not None}
+        
+        with self.lock:
+            low = 0
+            high = len(self.alarm_numbers)
+            if after_id is not None:
+                low = bisect.bisect_right(self.alarm_numbers, after_id)
+            if before_id is not None:
+                high = bisect.bisect_left(self.alarm_numbers, before_id)
+            if low >= high:
+                return []
+            
+            smallest = None
+            if filters:
+                buckets = [self._sorted_bucket(field, value) for field, value in filters.items()]
+                smallest = min(buckets, key=len)
+            
+            if smallest is not None and len(smallest) < high - low:
+                candidates = reversed(smallest.values()) if descending else iter(smallest.values())
+            else:
+                numbers = self.alarm_numbers[low:high]
+                if descending:
+                    numbers.reverse()
+                candidates = (self.alarms[f'alarm_{number}'] for number in numbers)
+            
+            results = []
+            for alarm in candidates:
+                number = alarm_number(alarm['id'])
+                if (after_id is not None and number <= after_id) or \
+                   (before_id is not None and number >= before_id):
+                    continue
+                if any(alarm.get(field) != value for field, value in filters.items()):
+                    continue
+                
+                timestamp = alarm.get('timestamp', '')
+                if (since is not None and timestamp < since) or \
+                   (until is not None and timestamp > until):
+                    continue
+                
+                results.append(alarm)
+                if limit is not None and len(results) >= limit:
+                    break
+            
+            return results
+    
+    def query_with_archive(self, **query):
+        hot = self.query_alarms(**query)
+        archived = self.archive.query(**query)
+        if not archived:
+            return hot
+        
+        # an alarm archived just before a crash can still be in the hot set; that copy wins
+        merged = {alarm['id']: alarm for alarm in archived}
+        merged.update((alarm['id'], alarm) for alarm in hot)
+        results = sorted(merged.values(), key=lambda alarm: alarm_number(alarm['id']),
+                         reverse=query.get('descending', False))
+        
+        limit = query.get('limit')
+        return results[:limit] if limit is not None else results
     
     def clear_alarms(self, alarm_ids):
         with self.lock:
-            cleared_count = 0
-            for alarm in self.alarms:
-                if alarm['id'] in alarm_ids:
-                    alarm['status'] = 'cleared'
-                    cleared_count += 1
+            cleared_ids = []
+            for alarm_id in dict.fromkeys(alarm_ids):
+                alarm = self.alarms.get(alarm_id)
+                if alarm is not None:
+                    self._set_status(alarm, 'cleared')
+                    cleared_ids.append(alarm_id)
             
-            if cleared_count > 0:
-                self.save_alarms()
+            if cleared_ids:
+                self._append_journal({'op': 'clear', 'ids': cleared_ids})
             
-            return cleared_count
+            return len(cleared_ids)
     
     def reset_alarms(self):
         with self.lock:
-            self.alarms = []
-            self.alarm_id_counter = 1
+            self._reset_store()
+            self.archive.clear()
             self.save_alarms()
-            self._generate_dummy_alarms()
+        self._generate_dummy_alarms()
     
     def delete_alarm(self, alarm_id):
         with self.lock:
-            initial_length = len(self.alarms)
-            self.alarms = [alarm for alarm in self.alarms if alarm['id'] != alarm_id]
-            
-            if len(self.alarms) < initial_length:
-                self.save_alarms()
+            if self._remove_alarm(alarm_id) is not None:
+                self._append_journal({'op': 'delete', 'id': alarm_id})
                 print(f'Deleted alarm: {alarm_id}')
                 return True
             
@@ -195,33 +506,770 @@ class AlarmManager:
     def delete_all_alarms(self):
         with self.lock:
             count = len(self.alarms)
-            self.alarms = []
-            self.alarm_id_counter = 1
+            self._reset_store()
+            self.archive.clear()
             self.save_alarms()
             print(f'Deleted all alarms ({count} total)')
             return count
     
+    def _append_journal(self, event):
+        self.journal_seq += 1
+        event['seq'] = self.journal_seq
+        
+        try:
+            if self.journal is None:
+                self.journal = open(self.alarm_journal_file, 'a')
+            self.journal.write(json.dumps(event, separators=(',', ':')) + '\n')
+            self.journal.flush()
+        except Exception as e:
+            print(f'Failed to write alarm journal: {e}')
+            return
+        
+        self.journal_events += 1
+        if self.journal_events >= max(self.JOURNAL_COMPACT_EVERY, len(self.alarms) * self.JOURNAL_COMPACT_RATIO):
+            self.save_alarms()
+    
+    def _apply_journal_event(self, alarms, event):
+        op = event.get('op')
+        
+        if op == 'add':
+            alarm = event['alarm']
+            alarms[alarm['id']] = alarm
+            self.alarm_id_counter = max(self.alarm_id_counter, alarm_number(alarm['id']) + 1)
+        elif op == 'clear':
+            for alarm_id in event['ids']:
+                if alarm_id in alarms:
+                    alarms[alarm_id]['status'] = 'cleared'
+        elif op == 'delete':
+            alarms.pop(event['id'], None)
+        elif op == 'archive':
+            for alarm_id in event['ids']:
+                alarms.pop(alarm_id, None)
+    
     def save_alarms(self):
+        save_start = time.perf_counter()
+        snapshot = {
+            'version': 2,
+            'journal_seq': self.journal_seq,
+            'alarm_id_counter': self.alarm_id_counter,
+            'alarms': list(self.alarms.values())
+        }
+        tmp_file = self.alarm_history_file + '.tmp'
+        
         try:
-            with open(self.alarm_history_file, 'w') as f:
-                json.dump(self.alarms, f, indent=2)
+            with open(tmp_file, 'w') as f:
+                json.dump(snapshot, f, separators=(',', ':'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.alarm_history_file)
+            
+            if self.journal is not None:
+                self.journal.close()
+            self.journal = open(self.alarm_journal_file, 'w')
+            self.journal_events = 0
         except Exception as e:
             print(f'Failed to save alarms: {e}')
+        
+        self.save_latency.observe(time.perf_counter() - save_start)
     
-    def load_alarms(self):
+    def _replay_journal(self, alarms):
+        replayed = 0
+        valid_bytes = 0
+        
+        try:
+            with open(self.alarm_journal_file, 'rb') as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        print(f'Discarding torn alarm journal record at byte {valid_bytes}')
+                        break
+                    
+                    valid_bytes += len(line)
+                    if event.get('seq', 0) <= self.journal_seq:
+                        continue
+                    
+                    self._apply_journal_event(alarms, event)
+                    self.journal_seq = event['seq']
+                    replayed += 1
+            
+            if valid_bytes < os.path.getsize(self.alarm_journal_file):
+                with open(self.alarm_journal_file, 'r+b') as f:
+                    f.truncate(valid_bytes)
+        except FileNotFoundError:
+            pass
+        
+        self.journal_events = replayed
+        return replayed
+    
+    def _read_history(self):
+        alarms = {}
+        migrated = False
+        
         try:
             with open(self.alarm_history_file, 'r') as f:
-                self.alarms = json.load(f)
-                if self.alarms:
-                    max_id = max([int(a['id'].split('_')[1]) for a in self.alarms])
-                    self.alarm_id_counter = max_id + 1
-                print(f'Loaded {len(self.alarms)} alarms from {self.alarm_history_file}')
+                snapshot = json.load(f)
+            
+            if isinstance(snapshot, list):
+                snapshot_alarms = snapshot
+                self.journal_seq = 0
+                migrated = True
+            else:
+                snapshot_alarms = snapshot.get('alarms', [])
+                self.journal_seq = snapshot.get('journal_seq', 0)
+                self.alarm_id_counter = snapshot.get('alarm_id_counter', 1)
+            
+            for alarm in snapshot_alarms:
+                alarms[alarm['id']] = alarm
+            
+            # journaled snapshots carry alarm_id_counter; only the legacy list needs the scan
+            if migrated and alarms:
+                max_id = max([alarm_number(alarm_id) for alarm_id in alarms])
+                self.alarm_id_counter = max(self.alarm_id_counter, max_id + 1)
+            print(f'Loaded {len(alarms)} alarms from {self.alarm_history_file}')
         except FileNotFoundError:
-            self.alarms = []
             print(f'No alarm history found, starting fresh')
         except Exception as e:
             print(f'Failed to load alarms: {e}')
-            self.alarms = []
+            alarms = {}
+        
+        replayed = 0
+        if not migrated:
+            replayed = self._replay_journal(alarms)
+            if replayed:
+                print(f'Replayed {replayed} alarm journal events from {self.alarm_journal_file}')
+        
+        return alarms, migrated
+    
+    def load_alarms(self):
+        self._reset_store()
+        alarms, migrated = self._read_history()
+        
+        for alarm in alarms.values():
+            self._insert_alarm(alarm)
+        
+        if migrated:
+            self.save_alarms()
+            print(f'Migrated {self.alarm_history_file} to journal storage')
+    
+    def _retention_candidates(self, cutoff):
+        cleared = sorted(self.indexes['status'].get('cleared', {}).values(),
+                         key=lambda alarm: alarm_number(alarm['id']))
+        excess = len(cleared) - ALARM_HOT_CLEARED_LIMIT
+        return [
+            alarm_number(alarm['id']) for index, alarm in enumerate(cleared)
+            if index < excess or alarm.get('timestamp', '') < cutoff
+        ]
+    
+    def _take_archivable(self, numbers):
+        alarms = []
+        for number in numbers:
+            alarm = self.alarms.get(f'alarm_{number}')
+            if alarm is not None and alarm.get('status') == 'cleared':
+                alarms.append(alarm)
+        return alarms
+    
+    def _drop_archived(self, alarms):
+        alarm_ids = [alarm['id'] for alarm in alarms]
+        self._remove_alarms(alarm_ids)
+        self._append_journal({'op': 'archive', 'ids': alarm_ids})
+    
+    def enforce_retention(self):
+        if ALARM_RETENTION_HOURS <= 0:
+            return 0
+        
+        cutoff = (datetime.now() - timedelta(hours=ALARM_RETENTION_HOURS)).isoformat()
+        with self.lock:
+            numbers = self._retention_candidates(cutoff)
+        
+        # archive in batches so add_alarm is never held up behind a large backlog
+        archived = 0
+        for start in range(0, len(numbers), self.ARCHIVE_BATCH_SIZE):
+            with self.lock:
+                alarms = self._take_archivable(numbers[start:start + self.ARCHIVE_BATCH_SIZE])
+                if not alarms:
+                    continue
+                self.archive.write(alarms)
+                self._drop_archived(alarms)
+            archived += len(alarms)
+        
+        if archived:
+            with self.lock:
+                self.save_alarms()
+            print(f'Archived {archived} cleared alarms to {self.archive.directory}')
+        return archived
+    
+    def _retention_loop(self):
+        while True:
+            try:
+                self.enforce_retention()
+            except Exception as e:
+                print(f'Alarm retention failed: {e}')
+            time.sleep(ALARM_RETENTION_CHECK_SECONDS)
+    
+    def start_retention(self):
+        self.retention_thread = threading.Thread(target=self._retention_loop, daemon=True)
+        self.retention_thread.start()
+
+
+class SQLiteAlarmManager(AlarmManager):
+    COUNT_QUERIES = {
+        'lane': 'SELECT lane, COUNT(*) FROM alarms GROUP BY lane',
+        'type': 'SELECT type, COUNT(*) FROM alarms GROUP BY type',
+        'vehicle_type': 'SELECT vehicle_type, COUNT(*) FROM alarms GROUP BY vehicle_type'
+    }
+    
+    def __init__(self, database_file='alarm_history.db'):
+        self.database_file = database_file
+        self.db = None
+        self.pending_alarms = []
+        self.total_count = 0
+        self.status_counts = {}
+        self.FLUSH_BATCH_SIZE = 200
+        self.FLUSH_INTERVAL = 0.5
+        
+        super().__init__()
+        
+        self.flush_thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self.flush_thread.start()
+    
+    def _open_database(self):
+        self.db = sqlite3.connect(self.database_file, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS alarms (
+                number INTEGER PRIMARY KEY,
+                type TEXT,
+                lane TEXT,
+                vehicle_type TEXT,
+                status TEXT,
+                timestamp TEXT,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_alarms_timestamp ON alarms(timestamp);
+            CREATE INDEX IF NOT EXISTS idx_alarms_status ON alarms(status);
+            CREATE INDEX IF NOT EXISTS idx_alarms_lane ON alarms(lane);
+            CREATE INDEX IF NOT EXISTS idx_alarms_type ON alarms(type);
+            CREATE INDEX IF NOT EXISTS idx_alarms_vehicle_type ON alarms(vehicle_type);
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        ''')
+    
+    def _get_meta(self, key, default=None):
+        row = self.db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+    
+    def _set_meta(self, key, value):
+        self.db.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+    
+    def _row_to_alarm(self, row):
+        alarm = json.loads(row[1])
+        alarm['status'] = row[0]
+        return alarm
+    
+    def _flush_pending(self):
+        if self.pending_alarms:
+            self.db.executemany(
+                'INSERT OR REPLACE INTO alarms (number, type, lane, vehicle_type, status, timestamp, data) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(alarm_number(alarm['id']), alarm.get('type'), alarm.get('lane'),
+                  alarm.get('vehicle_type'), alarm.get('status'), alarm.get('timestamp'),
+                  json.dumps(alarm, separators=(',', ':')))
+                 for alarm in self.pending_alarms]
+            )
+            self.pending_alarms = []
+            self._set_meta('alarm_id_counter', self.alarm_id_counter)
+        self.db.commit()
+    
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.FLUSH_INTERVAL)
+            with self.lock:
+                if self.pending_alarms:
+                    try:
+                        self._flush_pending()
+                    except Exception as e:
+                        print(f'Failed to flush alarms to {self.database_file}: {e}')
+    
+    def _load_counts(self):
+        self.status_counts = dict(self.db.execute('SELECT status, COUNT(*) FROM alarms GROUP BY status'))
+        self.total_count = sum(self.status_counts.values())
+    
+    def _adjust_status_count(self, status, delta):
+        self.status_counts[status] = self.status_counts.get(status, 0) + delta
+        if self.status_counts[status] <= 0:
+            del self.status_counts[status]
+    
+    def _insert_alarm(self, alarm):
+        self.pending_alarms.append(alarm)
+        self.total_count += 1
+        self._adjust_status_count(alarm.get('status'), 1)
+        self.version += 1
+        
+        if len(self.pending_alarms) >= self.FLUSH_BATCH_SIZE:
+            self._flush_pending()
+    
+    def _remove_alarm(self, alarm_id):
+        try:
+            number = alarm_number(alarm_id)
+        except ValueError:
+            return None
+        
+        self._flush_pending()
+        row = self.db.execute('SELECT status, data FROM alarms WHERE number = ?', (number,)).fetchone()
+        if row is None:
+            return None
+        
+        self.db.execute('DELETE FROM alarms WHERE number = ?', (number,))
+        self.db.commit()
+        self.total_count -= 1
+        self._adjust_status_count(row[0], -1)
+        self.version += 1
+        return self._row_to_alarm(row)
+    
+    def _reset_store(self):
+        self.pending_alarms = []
+        self.alarm_id_counter = 1
+        self.total_count = 0
+        self.status_counts = {}
+        self.version += 1
+        
+        if self.db is not None:
+            self.db.execute('DELETE FROM alarms')
+            self._set_meta('alarm_id_counter', self.alarm_id_counter)
+            self.db.commit()
+    
+    def _append_journal(self, event):
+        pass
+    
+    def save_alarms(self):
+        save_start = time.perf_counter()
+        try:
+            self._flush_pending()
+        except Exception as e:
+            print(f'Failed to save alarms: {e}')
+        self.save_latency.observe(time.perf_counter() - save_start)
+    
+    def load_alarms(self):
+        self._open_database()
+        
+        if self._get_meta('initialized') is None:
+            alarms, _ = self._read_history()
+            self.pending_alarms = list(alarms.values())
+            self._set_meta('initialized', 1)
+            self._flush_pending()
+            if alarms:
+                print(f'Migrated {len(alarms)} alarms from {self.alarm_history_file} to {self.database_file}')
+        
+        max_number = self.db.execute('SELECT MAX(number) FROM alarms').fetchone()[0] or 0
+        self.alarm_id_counter = max(int(self._get_meta('alarm_id_counter', 1)), max_number + 1)
+        self._load_counts()
+        print(f'Opened {self.database_file} with {self.total_count} alarms')
+    
+    def _retention_candidates(self, cutoff):
+        self._flush_pending()
+        numbers = [row[0] for row in self.db.execute(
+            "SELECT number FROM alarms WHERE status = 'cleared' AND timestamp < ? ORDER BY number", (cutoff,)
+        )]
+        
+        excess = self.status_counts.get('cleared', 0) - ALARM_HOT_CLEARED_LIMIT
+        if excess > len(numbers):
+            oldest = [row[0] for row in self.db.execute(
+                "SELECT number FROM alarms WHERE status = 'cleared' ORDER BY number LIMIT ?", (excess,)
+            )]
+            numbers = sorted(set(numbers).union(oldest))
+        return numbers
+    
+    def _take_archivable(self, numbers):
+        if not numbers:
+            return []
+        
+        self._flush_pending()
+        wanted = set(numbers)
+        rows = self.db.execute(
+            "SELECT number, status, data FROM alarms WHERE status = 'cleared' AND number BETWEEN ? AND ?",
+            (numbers[0], numbers[-1])
+        )
+        return [self._row_to_alarm(row[1:]) for row in rows if row[0] in wanted]
+    
+    def _drop_archived(self, alarms):
+        self.db.executemany('DELETE FROM alarms WHERE number = ?',
+                            [(alarm_number(alarm['id']),) for alarm in alarms])
+        self.db.commit()
+        self.total_count -= len(alarms)
+        self._adjust_status_count('cleared', -len(alarms))
+        self.version += 1
+    
+    def get_all_alarms(self):
+        return self.query_alarms()
+    
+    def get_alarm(self, alarm_id):
+        try:
+            number = alarm_number(alarm_id)
+        except ValueError:
+            return None
+        
+        with self.lock:
+            self._flush_pending()
+            row = self.db.execute('SELECT status, data FROM alarms WHERE number = ?', (number,)).fetchone()
+            return self._row_to_alarm(row) if row else None
+    
+    def get_active_alarms(self):
+        return self.query_alarms(status='active')
+    
+    def get_active_count(self):
+        with self.lock:
+            return self.status_counts.get('active', 0)
+    
+    def get_total_count(self):
+        with self.lock:
+            return self.total_count
+    
+    def get_counts_by(self, field):
+        if field not in self.INDEXED_FIELDS:
+            raise KeyError(field)
+        
+        with self.lock:
+            if field == 'status':
+                return dict(self.status_counts)
+            self._flush_pending()
+            return dict(self.db.execute(self.COUNT_QUERIES[field]))
+    
+    def get_latest_id(self):
+        with self.lock:
+            self._flush_pending()
+            row = self.db.execute('SELECT MAX(number) FROM alarms').fetchone()
+            if row[0] is None:
+                return None
+            return f'alarm_{row[0]}'
+    
+    def query_alarms(self, status=None, lane=None, alarm_type=None, vehicle_type=None,
+                     since=None, until=None, after_id=None, before_id=None,
+                     limit=None, descending=False):
+        clauses = []
+        params = []
+        
+        conditions = [
+            ('status = ?', status),
+            ('lane = ?', lane.upper() if lane else None),
+            ('type = ?', alarm_type),
+            ('vehicle_type = ?', vehicle_type),
+            ('timestamp >= ?', since),
+            ('timestamp <= ?', until),
+            ('number > ?', after_id),
+            ('number < ?', before_id)
+        ]
+        for clause, value in conditions:
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        
+        sql = 'SELECT status, data FROM alarms'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY number DESC' if descending else ' ORDER BY number ASC'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        
+        with self.lock:
+            self._flush_pending()
+            return [self._row_to_alarm(row) for row in self.db.execute(sql, params)]
+    
+    def clear_alarms(self, alarm_ids):
+        with self.lock:
+            self._flush_pending()
+            
+            cleared_ids = []
+            for alarm_id in dict.fromkeys(alarm_ids):
+                try:
+                    number = alarm_number(alarm_id)
+                except ValueError:
+                    continue
+                
+                row = self.db.execute('SELECT status FROM alarms WHERE number = ?', (number,)).fetchone()
+                if row is None:
+                    continue
+                
+                self.db.execute("UPDATE alarms SET status = 'cleared' WHERE number = ?", (number,))
+                self._adjust_status_count(row[0], -1)
+                self._adjust_status_count('cleared', 1)
+                cleared_ids.append(alarm_id)
+            
+            if cleared_ids:
+                self.db.commit()
+                self.version += 1
+            
+            return len(cleared_ids)
+    
+    def delete_all_alarms(self):
+        with self.lock:
+            count = self.total_count
+            self._reset_store()
+            self.archive.clear()
+            print(f'Deleted all alarms ({count} total)')
+            return count
+
+
+class MemoryAlarmManager(AlarmManager):
+    # fallback when the alarm history can't be loaded: nothing is read from or
+    # written to the history files or the archive, so a broken store is left as
+    # it was found
+    def _open_archive(self):
+        return NullAlarmArchive()
+    
+    def _generate_dummy_alarms(self):
+        pass
+    
+    def _append_journal(self, event):
+        pass
+    
+    def save_alarms(self):
+        pass
+    
+    def load_alarms(self):
+        self._reset_store()
+
+
+class SlidingWindowCounter:
+    def __init__(self, max_window_seconds=7200, bucket_seconds=1):
+        self.bucket_seconds = bucket_seconds
+        self.size = int(max_window_seconds // bucket_seconds) + 1
+        self.lock = threading.Lock()
+        self.reset()
+    
+    def reset(self, now=None):
+        with self.lock:
+            self.totals = {}
+            self.rings = {}
+            self.start_bucket = self._bucket(now)
+            self.current_bucket = self.start_bucket
+    
+    def _bucket(self, now=None):
+        if now is None:
+            now = time.time()
+        return int(now // self.bucket_seconds)
+    
+    def _advance(self, now=None):
+        bucket = self._bucket(now)
+        steps = bucket - self.current_bucket
+        if steps <= 0:
+            return
+        
+        steps = min(steps, self.size)
+        for key, ring in self.rings.items():
+            total = self.totals[key]
+            for offset in range(1, steps + 1):
+                ring[(self.current_bucket + offset) % self.size] = total
+        
+        self.current_bucket = bucket
+    
+    def add(self, key, count=1, now=None):
+        with self.lock:
+            self._advance(now)
+            
+            if key not in self.rings:
+                self.rings[key] = [0] * self.size
+                self.totals[key] = 0
+            
+            self.totals[key] += count
+            self.rings[key][self.current_bucket % self.size] = self.totals[key]
+    
+    def _count(self, key, window_seconds):
+        total = self.totals.get(key, 0)
+        if total == 0:
+            return 0
+        
+        buckets = min(int(-(-window_seconds // self.bucket_seconds)), self.size - 1)
+        boundary = self.current_bucket - buckets
+        if boundary < self.start_bucket:
+            return total
+        
+        return total - self.rings[key][boundary % self.size]
+    
+    def count_many(self, keys, window_seconds, now=None):
+        with self.lock:
+            self._advance(now)
+            return [self._count(key, seconds) for key, seconds in zip(keys, window_seconds)]
+
+
+class StatsBroadcaster:
+    SECTIONS = ('counts.total', 'counts.in', 'counts.out', 'rates', 'thresholds_crossed', 'processing_status')
+    METRICS = ('counts', 'rates', 'thresholds_crossed', 'processing_status')
+    LANES = ('total', 'in', 'out')
+    
+    def __init__(self, stream_id=DEFAULT_STREAM_ID):
+        self.stream_id = stream_id
+        self.room_prefix = 'stats' if stream_id == DEFAULT_STREAM_ID else f'stats:{stream_id}'
+        self.all_room = self.room('all')
+        
+        self.lock = threading.Lock()
+        self.sections = {}
+        self.seqs = {name: 0 for name in self.SECTIONS}
+        self.subscriptions = {}
+    
+    def room(self, name):
+        return f'{self.room_prefix}:{name}'
+    
+    def split_sections(self, stats):
+        return {
+            'counts.total': stats['counts']['total'],
+            'counts.in': stats['counts']['in'],
+            'counts.out': stats['counts']['out'],
+            'rates': stats['rates'],
+            'thresholds_crossed': stats['thresholds_crossed'],
+            'processing_status': stats['processing_status']
+        }
+    
+    def resolve_sections(self, data):
+        metrics = data.get('metrics') or self.METRICS
+        lanes = data.get('lanes') or self.LANES
+        
+        sections = []
+        for metric in metrics:
+            if metric == 'counts':
+                sections.extend(f'counts.{lane}' for lane in lanes if lane in self.LANES)
+            elif metric in self.METRICS:
+                sections.append(metric)
+        return sections
+    
+    def publish(self, stats):
+        changed = []
+        
+        with self.lock:
+            for name, value in self.split_sections(stats).items():
+                previous = self.sections.get(name)
+                if previous == value:
+                    continue
+                
+                self.sections[name] = value
+                self.seqs[name] += 1
+                
+                delta = {'stream_id': self.stream_id, 'section': name, 'seq': self.seqs[name]}
+                if isinstance(value, dict) and isinstance(previous, dict) and previous.keys() == value.keys():
+                    delta['changes'] = {key: item for key, item in value.items() if previous[key] != item}
+                else:
+                    delta['value'] = value
+                changed.append(delta)
+        
+        if not changed:
+            return False
+        
+        for delta in changed:
+            socketio.emit('stats_delta', delta, to=self.room(delta['section']))
+        socketio.emit('stats_update', stats, to=self.all_room)
+        return True
+    
+    def subscribe(self, sid, sections):
+        with self.lock:
+            previous = self.subscriptions.get(sid, [])
+            self.subscriptions[sid] = sections
+        return previous
+    
+    def unsubscribe(self, sid):
+        with self.lock:
+            return self.subscriptions.pop(sid, [])
+    
+    def snapshot(self, sid):
+        with self.lock:
+            sections = self.subscriptions.get(sid, [])
+            return {
+                'stream_id': self.stream_id,
+                'sections': {name: self.sections.get(name) for name in sections},
+                'seqs': {name: self.seqs[name] for name in sections}
+            }
+
+
+class AlarmBroadcaster:
+    # add_alarm only appends to a bounded queue; a separate thread turns bursts
+    # into one alarms_batch per client, at most one per client_interval. A client
+    # that falls further behind than the queue holds is told how many it missed.
+    def __init__(self, batch_window=ALARM_BATCH_WINDOW, client_interval=ALARM_CLIENT_MIN_INTERVAL,
+                 queue_limit=ALARM_QUEUE_LIMIT):
+        self.batch_window = batch_window
+        self.client_interval = client_interval
+        self.lock = threading.Lock()
+        self.pending = threading.Event()
+        self.recent = deque(maxlen=queue_limit)
+        self.seq = 0
+        self.clients = {}
+        self.batches_sent = 0
+        self.dropped = 0
+        self.thread = None
+    
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+    
+    def publish(self, alarm):
+        with self.lock:
+            self.seq += 1
+            self.recent.append(alarm)
+        self.pending.set()
+    
+    def add_client(self, sid):
+        with self.lock:
+            self.clients[sid] = [self.seq, 0.0]
+    
+    def remove_client(self, sid):
+        with self.lock:
+            self.clients.pop(sid, None)
+    
+    def _collect(self, now):
+        batches = {}
+        next_due = None
+        
+        with self.lock:
+            oldest = self.seq - len(self.recent) + 1
+            for sid, state in self.clients.items():
+                last_seq, due = state
+                if last_seq >= self.seq:
+                    continue
+                if now < due:
+                    next_due = due if next_due is None else min(next_due, due)
+                    continue
+                
+                batches.setdefault(last_seq, []).append(sid)
+                state[0] = self.seq
+                state[1] = now + self.client_interval
+            
+            # clients that were last served at the same point get the same payload
+            payloads = []
+            for last_seq, sids in batches.items():
+                start = max(last_seq + 1, oldest)
+                payloads.append((sids, {
+                    'alarms': list(itertools.islice(self.recent, start - oldest, None)),
+                    'dropped': start - last_seq - 1,
+                    'seq': self.seq
+                }))
+                self.dropped += (start - last_seq - 1) * len(sids)
+        
+        return payloads, next_due
+    
+    def flush(self, now=None):
+        payloads, next_due = self._collect(time.monotonic() if now is None else now)
+        for sids, payload in payloads:
+            try:
+                socketio.emit('alarms_batch', payload, to=sids)
+                self.batches_sent += 1
+            except Exception as e:
+                print(f'Alarm broadcast failed: {e}')
+        return next_due
+    
+    def _run(self):
+        timeout = None
+        while True:
+            self.pending.wait(timeout)
+            # let the rest of a burst arrive before sending anything
+            time.sleep(self.batch_window)
+            self.pending.clear()
+            
+            now = time.monotonic()
+            next_due = self.flush(now)
+            timeout = None if next_due is None else max(next_due - now, 0.0)
 
 
 class TrafficDataSimulator:
@@ -237,29 +1285,32 @@ class TrafficDataSimulator:
         self.processing_status = "Waiting for video upload..."
         self.last_rate_update = time.time()
         self.is_processing = False
+        
+        self.window_counter = SlidingWindowCounter(max_window_seconds=MAX_WINDOW_MINUTES * 60)
+        self.history = TrafficHistory()
     
-    def update_counts(self):
+    def update_counts(self, observed_counts=None):
         if not self.is_processing:
             return
         
-        in_increment = {
-            "2WHLR": random.randint(0, 5),
-            "LMV": random.randint(0, 3),
-            "HMV": random.randint(0, 2)
-        }
-        
-        out_increment = {
-            "2WHLR": random.randint(0, 4),
-            "LMV": random.randint(0, 2),
-            "HMV": random.randint(0, 1)
-        }
+        if observed_counts is not None:
+            in_increment = observed_counts['in']
+            out_increment = observed_counts['out']
+        else:
+            in_increment, out_increment = self._simulate_increments()
         
         for vehicle_type in ["2WHLR", "LMV", "HMV"]:
             self.in_counts[vehicle_type] += in_increment[vehicle_type]
             self.out_counts[vehicle_type] += out_increment[vehicle_type]
             self.total_counts[vehicle_type] = self.in_counts[vehicle_type] - self.out_counts[vehicle_type]
+            
+            if in_increment[vehicle_type]:
+                self.window_counter.add(('in', vehicle_type), in_increment[vehicle_type])
+            if out_increment[vehicle_type]:
+                self.window_counter.add(('out', vehicle_type), out_increment[vehicle_type])
         
         current_time = time.time()
+        self.history.record(current_time, in_increment, out_increment)
         
         if current_time - self.last_rate_update >= 1:
             time_elapsed = current_time - self.last_rate_update
@@ -271,42 +1322,20 @@ class TrafficDataSimulator:
             
             self.last_rate_update = current_time
     
-    def check_thresholds(self, current_thresholds):
-        self.thresholds_crossed = []
+    def _simulate_increments(self):
+        in_increment = {
+            "2WHLR": random.randint(0, 5),
+            "LMV": random.randint(0, 3),
+            "HMV": random.randint(0, 2)
+        }
         
-        for vehicle_type in ["2WHLR", "LMV", "HMV"]:
-            try:
-                max_count = current_thresholds['in'][vehicle_type]['max_count']
-                time_period = current_thresholds['in']['time_period']
-                
-                if self.in_counts[vehicle_type] >= max_count:
-                    self.thresholds_crossed.append({
-                        "lane": "IN",
-                        "vehicle_type": vehicle_type,
-                        "count": self.in_counts[vehicle_type],
-                        "max_count": max_count,
-                        "time_period": time_period,
-                        "message": f"{vehicle_type} count exceeded in IN lane: {self.in_counts[vehicle_type]} (limit: {max_count})"
-                    })
-            except KeyError:
-                pass
+        out_increment = {
+            "2WHLR": random.randint(0, 4),
+            "LMV": random.randint(0, 2),
+            "HMV": random.randint(0, 1)
+        }
         
-        for vehicle_type in ["2WHLR", "LMV", "HMV"]:
-            try:
-                max_count = current_thresholds['out'][vehicle_type]['max_count']
-                time_period = current_thresholds['out']['time_period']
-                
-                if self.out_counts[vehicle_type] >= max_count:
-                    self.thresholds_crossed.append({
-                        "lane": "OUT",
-                        "vehicle_type": vehicle_type,
-                        "count": self.out_counts[vehicle_type],
-                        "max_count": max_count,
-                        "time_period": time_period,
-                        "message": f"{vehicle_type} count exceeded in OUT lane: {self.out_counts[vehicle_type]} (limit: {max_count})"
-                    })
-            except KeyError:
-                pass
+        return in_increment, out_increment
     
     def get_current_stats(self):
         return {
@@ -320,12 +1349,9 @@ class TrafficDataSimulator:
             "processing_status": self.processing_status
         }
     
-    def get_count(self, lane, vehicle_type):
-        if lane == 'in':
-            return self.in_counts.get(vehicle_type, 0)
-        elif lane == 'out':
-            return self.out_counts.get(vehicle_type, 0)
-        return 0
+    def get_window_counts(self, table):
+        counts = self.window_counter.count_many(table.keys, table.window_seconds.ravel())
+        return np.array(counts, dtype=np.float64).reshape(table.shape)
     
     def reset_stats(self):
         self.total_counts = {"2WHLR": 0, "LMV": 0, "HMV": 0}
@@ -337,6 +1363,8 @@ class TrafficDataSimulator:
         self.processing_status = "Waiting for video upload..."
         self.is_processing = False
         self.last_rate_update = time.time()
+        self.window_counter.reset()
+        # history is kept across resets and uploads so it can still be charted and audited
     
     def start_processing(self):
         self.is_processing = True
@@ -348,305 +1376,648 @@ class TrafficDataSimulator:
         self.processing_status = "Processing stopped"
 
 
-class VideoProcessor:
-    def __init__(self, alarm_manager, traffic_data, current_thresholds_getter):
-        self.alarm_manager = alarm_manager
-        self.traffic_data = traffic_data
-        self.get_current_thresholds = current_thresholds_getter
-        
-        self.is_processing = False
-        self.processing_thread = None
-        self.video_path = None
+class FrameVariant:
+    def __init__(self, width, quality):
+        self.width = width
+        self.quality = quality
+        self.frame_bytes = None
+        self.frame_seq = 0
+        self.subscribers = 0
+
+
+class FrameBroadcaster:
+    def __init__(self, video_processor):
+        self.video_processor = video_processor
         
-        self.current_frame = None
-        self.frame_lock = threading.Lock()
+        self.condition = threading.Condition()
+        self.variants = {}
+        self.source_seq = None
+        self.subscribers = 0
+        self.encoder_thread = None
         
-        self.PROCESS_EVERY_N_FRAMES = 2
-        self.FPS = 30
+        self.POLL_INTERVAL = 0.033
+        self.RESEND_INTERVAL = 0.5
         
-        print("Simple VideoProcessor initialized")
+        from video_pipeline import StageStats
+        self.encode_stats = StageStats('encode')
+        self.frames_sent = 0
+        self.bytes_sent = 0
     
-    def start_processing(self, video_path):
-        if self.is_processing:
-            print("Processing already running")
-            return False
-        
-        if not video_path or not isinstance(video_path, str):
-            print("Invalid video path")
-            return False
-        
-        self.video_path = video_path
-        self.is_processing = True
+    def variant_key(self, width=None, quality=None):
+        if width is not None and width > 0:
+            width = max(MIN_VARIANT_WIDTH, min(MAX_VARIANT_WIDTH, width))
+            width -= width % 16
+        else:
+            width = None
         
-        self.processing_thread = threading.Thread(
-            target=self._process_video,
-            daemon=True
-        )
-        self.processing_thread.start()
+        if quality is None:
+            quality = DEFAULT_JPEG_QUALITY
+        quality = max(MIN_JPEG_QUALITY, min(MAX_JPEG_QUALITY, quality))
+        quality -= quality % 5
         
-        print("Simple video processing started")
-        return True
+        return width, quality
     
-    def stop_processing(self):
-        if not self.is_processing:
-            return
-        
-        print("Stopping simple video processing...")
-        self.is_processing = False
-        
-        if self.processing_thread and self.processing_thread.is_alive():
-            self.processing_thread.join(timeout=2)
-        
-        with self.frame_lock:
-            self.current_frame = None
-        
-        print("Simple video processing stopped")
+    def subscribe(self, key):
+        with self.condition:
+            variant = self.variants.get(key)
+            if variant is None:
+                if len(self.variants) >= MAX_FRAME_VARIANTS:
+                    return False
+                variant = FrameVariant(*key)
+                self.variants[key] = variant
+                # force the next source frame to be encoded for the new variant
+                self.source_seq = None
+            
+            variant.subscribers += 1
+            self.subscribers += 1
+            if self.encoder_thread is None:
+                self.encoder_thread = threading.Thread(target=self._encode_loop, daemon=True)
+                self.encoder_thread.start()
+            return True
     
-    def get_current_frame(self):
-        with self.frame_lock:
-            if self.current_frame is not None:
-                return self.current_frame.copy()
-        return None
+    def unsubscribe(self, key):
+        with self.condition:
+            variant = self.variants.get(key)
+            if variant is None:
+                return
+            
+            variant.subscribers -= 1
+            self.subscribers -= 1
+            if variant.subscribers <= 0:
+                del self.variants[key]
     
-    def _process_video(self):
-        print(f"Opening video: {self.video_path}")
-        cap = cv2.VideoCapture(self.video_path)
-        
-        if not cap.isOpened():
-            print(f"Failed to open video: {self.video_path}")
-            self.is_processing = False
-            return
-        
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        if fps and fps > 0:
-            self.FPS = fps
-        else:
-            self.FPS = 30
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        
-        print(f"Video info: {total_frames} frames @ {self.FPS:.2f} FPS")
+    def wait_for_frame(self, key, last_seq):
+        with self.condition:
+            variant = self.variants.get(key)
+            if variant is None:
+                return last_seq, None
+            
+            self.condition.wait_for(
+                lambda: variant.frame_bytes is not None and variant.frame_seq != last_seq,
+                timeout=self.RESEND_INTERVAL
+            )
+            if variant.frame_bytes is not None:
+                self.frames_sent += 1
+                self.bytes_sent += len(variant.frame_bytes)
+            return variant.frame_seq, variant.frame_bytes
+    
+    def get_variants(self):
+        with self.condition:
+            return [
+                {'width': v.width, 'quality': v.quality, 'subscribers': v.subscribers}
+                for v in self.variants.values()
+            ]
+    
+    def _publish(self, encoded):
+        with self.condition:
+            for key, jpeg_bytes in encoded.items():
+                variant = self.variants.get(key)
+                if variant is None:
+                    continue
+                variant.frame_bytes = (b'--frame\r\n'
+                                       b'Content-Type: image/jpeg\r\n\r\n' + jpeg_bytes + b'\r\n')
+                variant.frame_seq += 1
+            self.condition.notify_all()
+    
+    def _encode_variants(self, frame, keys):
+        import cv2
         
-        frame_count = 0
+        height, width = frame.shape[:2]
+        resized = {}
+        encoded = {}
         
-        while cap.isOpened() and self.is_processing:
-            ret, frame = cap.read()
-            if not ret:
-                print("Video ended, looping...")
-                cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                frame_count = 0
-                continue
+        for key in keys:
+            target_width, quality = key
             
-            frame_count += 1
+            if target_width is None or target_width >= width:
+                image = frame
+            else:
+                # variants sharing a width but not a quality reuse the same resize
+                image = resized.get(target_width)
+                if image is None:
+                    target_height = max(1, round(height * target_width / width))
+                    image = cv2.resize(frame, (target_width, target_height), interpolation=cv2.INTER_AREA)
+                    resized[target_width] = image
             
-            if frame_count % self.PROCESS_EVERY_N_FRAMES != 0:
-                with self.frame_lock:
-                    self.current_frame = frame
-                continue
+            ret, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if ret:
+                encoded[key] = buffer.tobytes()
+        
+        return encoded
+    
+    def _encode_loop(self):
+        print("Frame broadcaster started")
+        
+        while True:
+            with self.condition:
+                if self.subscribers <= 0:
+                    self.encoder_thread = None
+                    self.source_seq = None
+                    print("Frame broadcaster stopped (no subscribers)")
+                    return
+                keys = list(self.variants.keys())
+                source_seq = self.source_seq
             
             try:
-                annotated = self._draw_dummy_boxes(frame, frame_count)
+                seq, frame = self.video_processor.get_latest_frame()
                 
-                with self.frame_lock:
-                    self.current_frame = annotated
+                if frame is None:
+                    if source_seq != 'placeholder':
+                        placeholder = get_placeholder_frame()
+                        self._publish({key: placeholder for key in keys})
+                        with self.condition:
+                            if self.source_seq == source_seq:
+                                self.source_seq = 'placeholder'
+                    time.sleep(0.1)
+                    continue
+                
+                if seq != source_seq:
+                    encode_start = time.time()
+                    encoded = run_blocking(self._encode_variants, frame, keys)
+                    self.encode_stats.record(time.time() - encode_start)
+                    if self.video_processor.is_frame_intact(seq):
+                        self._publish(encoded)
+                    with self.condition:
+                        if self.source_seq == source_seq:
+                            self.source_seq = seq
             
             except Exception as e:
-                print(f"Frame {frame_count} error: {e}")
+                print(f"Frame broadcaster error: {e}")
+                time.sleep(0.1)
             
-            time.sleep(0.01)
-        
-        cap.release()
-        print("Simple video processing loop ended")
-    
-    def _draw_dummy_boxes(self, frame, frame_count):
-        h, w, _ = frame.shape
-        boxes = []
-        
-        x1 = int((frame_count * 5) % (w - 100))
-        y1 = int(h * 0.3)
-        boxes.append((x1, y1, x1 + 120, y1 + 60, (0, 255, 0), "2WHLR"))
-        
-        x2 = int((frame_count * 3) % (w - 150))
-        y2 = int(h * 0.5)
-        boxes.append((x2, y2, x2 + 160, y2 + 80, (255, 0, 0), "LMV"))
-        
-        x3 = int((frame_count * 2) % (w - 180))
-        y3 = int(h * 0.7)
-        boxes.append((x3, y3, x3 + 180, y3 + 90, (0, 165, 255), "HMV"))
-        
-        annotated = frame.copy()
-        
-        for (x1, y1, x2, y2, color, label) in boxes:
-            cv2.rectangle(annotated, (x1, y1), (x2, y2), color, 2)
-            cv2.putText(
-                annotated,
-                label,
-                (x1 + 5, y1 - 10),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                0.6,
-                color,
-                2,
-                cv2.LINE_AA,
-            )
-        
-        cv2.putText(
-            annotated,
-            f"Frame: {frame_count}",
-            (10, 30),
-            cv2.FONT_HERSHEY_SIMPLEX,
-            0.8,
-            (255, 255, 255),
-            2,
-            cv2.LINE_AA,
-        )
-        
-        return annotated
+            time.sleep(self.POLL_INTERVAL)
 
 
-traffic_data = TrafficDataSimulator()
-alarm_manager = AlarmManager()
+def create_alarm_manager():
+    if ALARM_STORAGE_BACKEND == 'sqlite':
+        print(f'Using SQLite alarm storage: {ALARM_DATABASE_FILE}')
+        return SQLiteAlarmManager(ALARM_DATABASE_FILE)
+    return AlarmManager()
 
 
-def get_current_thresholds():
-    global current_thresholds
-    return current_thresholds
+alarm_broadcaster = AlarmBroadcaster()
 
 
-video_processor = VideoProcessor(
-    alarm_manager,
-    traffic_data,
-    get_current_thresholds
-)
-print("VideoProcessor initialized")
+class VideoStream:
+    def __init__(self, stream_id, decoder_slots):
+        self.stream_id = stream_id
+        self.decoder_slots = decoder_slots
+        self.traffic_data = TrafficDataSimulator()
+        self.stats_broadcaster = StatsBroadcaster(stream_id)
+        
+        # the decode pipeline, and with it cv2, is only brought up on first video use
+        self.pipeline_lock = threading.Lock()
+        self._video_processor = None
+        self._frame_broadcaster = None
+        
+        self.video = None
+        self.last_violation_time = new_violation_times()
+        # kept here so they can be read and set without bringing up the pipeline
+        self.counting_lines = [dict(line) for line in DEFAULT_COUNTING_LINES]
+        
+        if stream_id == DEFAULT_STREAM_ID:
+            self.video_path = 'temp_video.mp4'
+        else:
+            self.video_path = f'temp_video_{stream_id}.mp4'
+        
+        self.history_path = os.path.join(TRAFFIC_HISTORY_DIR, f'{stream_id}.npz')
+        if TRAFFIC_HISTORY_FLUSH_SECONDS > 0:
+            self.traffic_data.history.load(self.history_path)
+    
+    @property
+    def has_pipeline(self):
+        return self._video_processor is not None
+    
+    @property
+    def video_processor(self):
+        if self._video_processor is None:
+            self._start_pipeline()
+        return self._video_processor
+    
+    @property
+    def frame_broadcaster(self):
+        if self._frame_broadcaster is None:
+            self._start_pipeline()
+        return self._frame_broadcaster
+    
+    def _start_pipeline(self):
+        with self.pipeline_lock:
+            if self._video_processor is not None:
+                return
+            
+            started = time.perf_counter()
+            from video_pipeline import VideoProcessor, ProcessVideoProcessor
+            
+            processor_class = ProcessVideoProcessor if VIDEO_PROCESS_MODE == 'process' else VideoProcessor
+            video_processor = processor_class(decoder_slots=self.decoder_slots)
+            video_processor.DETECTION_MODE = DETECTION_MODE
+            video_processor.set_counting_lines(self.counting_lines)
+            self._frame_broadcaster = FrameBroadcaster(video_processor)
+            self._video_processor = video_processor
+            print(f'Video pipeline for {self.stream_id} started in {(time.perf_counter() - started) * 1000:.1f} ms')
+    
+    def set_counting_lines(self, lines):
+        with self.pipeline_lock:
+            self.counting_lines = [dict(line) for line in lines]
+            if self._video_processor is not None:
+                self._video_processor.set_counting_lines(self.counting_lines)
+    
+    def stop(self):
+        self.traffic_data.stop_processing()
+        if self.has_pipeline:
+            self.video_processor.stop_processing()
+        self.video = None
+    
+    def describe(self):
+        video = self.video
+        return {
+            'stream_id': self.stream_id,
+            'video_uploaded': video is not None,
+            'video_size_mb': round(video['size'] / (1024 * 1024), 2) if video else None,
+            'is_processing': self.has_pipeline and self.video_processor.is_processing,
+            'processing_status': self.traffic_data.processing_status
+        }
+
+
+class StreamRegistry:
+    def __init__(self, max_streams, max_decoders):
+        self.max_streams = max_streams
+        self.max_decoders = max_decoders
+        if VIDEO_PROCESS_MODE == 'process':
+            self.decoder_slots = multiprocessing.get_context('spawn').BoundedSemaphore(max_decoders)
+        else:
+            self.decoder_slots = threading.BoundedSemaphore(max_decoders)
+        self.lock = threading.Lock()
+        self.streams = {}
+    
+    def get(self, stream_id):
+        with self.lock:
+            return self.streams.get(stream_id)
+    
+    def get_or_create(self, stream_id):
+        with self.lock:
+            if stream_id in self.streams:
+                return self.streams[stream_id]
+            
+            if len(self.streams) >= self.max_streams:
+                return None
+            
+            stream = VideoStream(stream_id, self.decoder_slots)
+            self.streams[stream_id] = stream
+            print(f'Stream registered: {stream_id} ({len(self.streams)}/{self.max_streams})')
+            return stream
+    
+    def remove(self, stream_id):
+        if stream_id == DEFAULT_STREAM_ID:
+            return False
+        
+        with self.lock:
+            stream = self.streams.pop(stream_id, None)
+        
+        if stream is None:
+            return False
+        
+        stream.stop()
+        # stream ids are client chosen, so don't leave their uploads behind
+        try:
+            os.remove(stream.video_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f'Failed to remove {stream.video_path}: {e}')
+        print(f'Stream removed: {stream_id}')
+        return True
+    
+    def list_streams(self):
+        with self.lock:
+            return list(self.streams.values())
+
+
+def install_thresholds(thresholds):
+    global current_thresholds, threshold_table
+    # compile first, then swap the reference: the updater reads threshold_table
+    # once per tick and sees either the old table or the new one, never a mix
+    table = compile_thresholds(thresholds)
+    current_thresholds = thresholds
+    threshold_table = table
 
 
 def load_thresholds():
-    global current_thresholds
     try:
         if os.path.exists(THRESHOLDS_FILE):
             with open(THRESHOLDS_FILE, 'r') as f:
-                current_thresholds = json.load(f)
+                install_thresholds(json.load(f))
                 print(f'Thresholds loaded from {THRESHOLDS_FILE}')
                 print(json.dumps(current_thresholds, indent=2))
         else:
-            current_thresholds = DEFAULT_THRESHOLDS.copy()
+            install_thresholds(DEFAULT_THRESHOLDS.copy())
             save_thresholds()
             print('Default thresholds created')
     except Exception as e:
         print(f'Failed to load thresholds: {e}')
-        current_thresholds = DEFAULT_THRESHOLDS.copy()
+        install_thresholds(DEFAULT_THRESHOLDS.copy())
+
+
+def save_thresholds():
+    try:
+        with open(THRESHOLDS_FILE, 'w') as f:
+            json.dump(current_thresholds, f, indent=2)
+        print(f'Thresholds saved to {THRESHOLDS_FILE}')
+        print(json.dumps(current_thresholds, indent=2))
+    except Exception as e:
+        print(f'Failed to save thresholds: {e}')
+
+
+def check_violation(vehicle_type, lane, count_in_period, table, stream_id=DEFAULT_STREAM_ID):
+    time_period = table.thresholds[lane]['time_period']
+    max_count = table.thresholds[lane][vehicle_type]['max_count']
+    violation_message = f'{vehicle_type} count exceeded in {lane.upper()} lane: {count_in_period} vehicles in {time_period} min (limit: {max_count})'
+    
+    alarm_manager.add_alarm(
+        alarm_type='threshold_exceeded',
+        lane=lane.upper(),
+        vehicle_type=vehicle_type,
+        details=violation_message,
+        count=count_in_period,
+        max_count=max_count,
+        stream_id=stream_id
+    )
+    
+    return {
+        'type': 'count_exceeded',
+        'lane': lane.upper(),
+        'vehicle_type': vehicle_type,
+        'message': violation_message,
+        'count': count_in_period,
+        'max_count': max_count,
+        'stream_id': stream_id,
+    }
+
+
+def update_stream(stream, current_time):
+    VIOLATION_COOLDOWN = 60
+    traffic_data = stream.traffic_data
+    last_violation_time = stream.last_violation_time
+    
+    observed_counts = stream.video_processor.drain_detection_counts() if stream.has_pipeline else None
+    traffic_data.update_counts(observed_counts)
+    
+    table = threshold_table
+    counts = traffic_data.get_window_counts(table)
+    due = table.due(counts, last_violation_time, current_time, VIOLATION_COOLDOWN)
+    
+    violations = []
+    for lane, vehicle_type, lane_index, type_index in table.cells(due):
+        count = int(counts[lane_index, type_index])
+        violations.append(check_violation(vehicle_type, lane, count, table, stream.stream_id))
+        last_violation_time[lane_index, type_index] = current_time
+    
+    traffic_data.thresholds_crossed = violations
+    
+    try:
+        stats = traffic_data.get_current_stats()
+        stream.stats_broadcaster.publish(stats)
+    except:
+        pass
+
+
+updater_tick_seconds = Histogram(TICK_BUCKETS)
+updater_drift_seconds = Histogram(TICK_BUCKETS)
+
+
+def flush_traffic_history():
+    for stream in stream_registry.list_streams():
+        try:
+            run_blocking(stream.traffic_data.history.flush, stream.history_path)
+        except Exception as e:
+            print(f'Failed to flush traffic history for {stream.stream_id}: {e}')
+
+
+def background_data_updater():
+    global backend_polling_rate
+    # threshold violations raise alarms, so wait for the alarm history
+    alarms_ready.wait()
+    print("Background data updater started")
+    
+    expected_start = None
+    next_history_flush = time.monotonic() + TRAFFIC_HISTORY_FLUSH_SECONDS
+    while True:
+        with polling_rate_lock:
+            current_rate = backend_polling_rate
+        
+        tick_start = time.perf_counter()
+        if expected_start is not None:
+            updater_drift_seconds.observe(max(tick_start - expected_start, 0.0))
+        
+        current_time = time.time()
+        for stream in stream_registry.list_streams():
+            try:
+                update_stream(stream, current_time)
+            except Exception as e:
+                print(f'Stream {stream.stream_id} update failed: {e}')
+        
+        if TRAFFIC_HISTORY_FLUSH_SECONDS > 0 and time.monotonic() >= next_history_flush:
+            flush_traffic_history()
+            next_history_flush = time.monotonic() + TRAFFIC_HISTORY_FLUSH_SECONDS
+        
+        tick_end = time.perf_counter()
+        updater_tick_seconds.observe(tick_end - tick_start)
+        expected_start = tick_end + current_rate
+        
+        time.sleep(current_rate)
+
+
+class StartupReport:
+    def __init__(self, started):
+        self.started = started
+        self.lock = threading.Lock()
+        self.phases = []
+        self.failures = []
+    
+    def record(self, name, seconds):
+        with self.lock:
+            self.phases.append((name, seconds))
+        print(f'Startup phase {name}: {seconds * 1000:.1f} ms')
+    
+    @contextlib.contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+    
+    def fail(self, name, error):
+        with self.lock:
+            self.failures.append((name, str(error)))
+        print(f'Startup phase {name} failed: {error}')
+    
+    def snapshot(self):
+        with self.lock:
+            return [{'phase': name, 'ms': round(seconds * 1000, 1)} for name, seconds in self.phases]
+    
+    def failed(self):
+        with self.lock:
+            return [{'phase': name, 'error': error} for name, error in self.failures]
+
+
+startup_report = StartupReport(PROCESS_STARTED)
+
+
+def load_alarm_history():
+    global alarm_manager
+    manager = None
+    delay = ALARM_LOAD_RETRY_SECONDS
+    try:
+        for attempt in range(1, max(1, ALARM_LOAD_ATTEMPTS) + 1):
+            try:
+                with startup_report.phase('alarms'):
+                    manager = create_alarm_manager()
+                break
+            except Exception as e:
+                error = e
+                print(f'Failed to load alarm history (attempt {attempt}): {e}')
+                if attempt < ALARM_LOAD_ATTEMPTS:
+                    time.sleep(delay)
+                    delay *= 2
+        
+        if manager is None:
+            # readiness reports the failure, but alarms and the updater still run
+            startup_report.fail('alarms', error)
+            manager = MemoryAlarmManager()
+            print('Alarm history unavailable, keeping alarms in memory only')
+        else:
+            manager.start_retention()
+        
+        alarm_manager = manager
+    finally:
+        # never leave /readyz and the updater waiting on a loader that died
+        alarms_ready.set()
+    startup_report.record('ready', time.perf_counter() - startup_report.started)
+
+
+def create_app():
+    global stream_registry, default_stream, traffic_data, stats_broadcaster, data_thread
+    if stream_registry is not None:
+        return app
+    
+    startup_report.record('imports', time.perf_counter() - startup_report.started)
+    
+    with startup_report.phase('thresholds'):
+        load_thresholds()
+    
+    with startup_report.phase('streams'):
+        stream_registry = StreamRegistry(MAX_STREAMS, MAX_CONCURRENT_DECODERS)
+        default_stream = stream_registry.get_or_create(DEFAULT_STREAM_ID)
+        traffic_data = default_stream.traffic_data
+        stats_broadcaster = default_stream.stats_broadcaster
+    
+    with startup_report.phase('background'):
+        alarm_broadcaster.start()
+        threading.Thread(target=load_alarm_history, daemon=True).start()
+        data_thread = threading.Thread(target=background_data_updater, daemon=True)
+        data_thread.start()
+    
+    startup_report.record('serving', time.perf_counter() - startup_report.started)
+    print("Server started")
+    return app
 
 
-def save_thresholds():
-    try:
-        with open(THRESHOLDS_FILE, 'w') as f:
-            json.dump(current_thresholds, f, indent=2)
-        print(f'Thresholds saved to {THRESHOLDS_FILE}')
-        print(json.dumps(current_thresholds, indent=2))
-    except Exception as e:
-        print(f'Failed to save thresholds: {e}')
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-def check_violation(vehicle_type, lane, count_in_period):
-    try:
-        time_period = current_thresholds[lane]['time_period']
-        max_count = current_thresholds[lane][vehicle_type]['max_count']
+def parse_byte_ranges(range_header, size):
+    if not range_header or not range_header.startswith('bytes='):
+        return None
+    
+    ranges = []
+    for spec in range_header[6:].split(','):
+        spec = spec.strip()
+        if '-' not in spec:
+            return None
         
-        if count_in_period > max_count:
-            violation_message = f'{vehicle_type} count exceeded in {lane.upper()} lane: {count_in_period} vehicles (limit: {max_count})'
-            
-            alarm_manager.add_alarm(
-                alarm_type='threshold_exceeded',
-                lane=lane.upper(),
-                vehicle_type=vehicle_type,
-                details=violation_message,
-                count=count_in_period,
-                max_count=max_count
-            )
+        start, end = spec.split('-', 1)
+        try:
+            if start == '':
+                suffix_length = int(end)
+                if suffix_length <= 0 or size == 0:
+                    continue
+                ranges.append((max(size - suffix_length, 0), size - 1))
+                continue
             
-            return {
-                'type': 'count_exceeded',
-                'lane': lane.upper(),
-                'vehicle_type': vehicle_type,
-                'message': violation_message,
-                'count': count_in_period,
-                'max_count': max_count,
-            }
-        
-        return None
-    except KeyError:
+            start = int(start)
+            end = int(end) if end else None
+        except ValueError:
+            return None
+        
+        if start < 0 or (end is not None and start > end):
+            return None
+        if start >= size:
+            continue
+        if end is None or end >= size:
+            end = size - 1
+        ranges.append((start, end))
+    
+    if len(ranges) > MAX_BYTE_RANGES:
         return None
+    
+    return ranges
 
 
-def background_data_updater():
-    global backend_polling_rate, current_thresholds
-    print("Background data updater started")
+def save_upload_stream(upload_stream, video_path):
+    video_dir = os.path.dirname(os.path.abspath(video_path))
+    fd, tmp_path = tempfile.mkstemp(dir=video_dir, prefix='.upload_', suffix='.part')
     
-    last_violation_time = {}
-    VIOLATION_COOLDOWN = 60
+    digest = hashlib.sha256()
+    size = 0
     
-    while True:
-        with polling_rate_lock:
-            current_rate = backend_polling_rate
-        
-        traffic_data.update_counts()
-        
-        violations = []
-        current_time = time.time()
-        
-        for vehicle_type in ['2WHLR', 'LMV', 'HMV']:
-            try:
-                time_period = current_thresholds['out']['time_period']
-                max_count = current_thresholds['out'][vehicle_type]['max_count']
-                count = traffic_data.get_count('out', vehicle_type)
-                
-                violation_key = f"out_{vehicle_type}"
-                if count > max_count:
-                    if violation_key not in last_violation_time or \
-                       (current_time - last_violation_time[violation_key]) > VIOLATION_COOLDOWN:
-                        violation = check_violation(vehicle_type, 'out', count)
-                        if violation:
-                            violations.append(violation)
-                            last_violation_time[violation_key] = current_time
-            except KeyError:
-                pass
-        
-        for vehicle_type in ['2WHLR', 'LMV', 'HMV']:
-            try:
-                time_period = current_thresholds['in']['time_period']
-                max_count = current_thresholds['in'][vehicle_type]['max_count']
-                count = traffic_data.get_count('in', vehicle_type)
-                
-                violation_key = f"in_{vehicle_type}"
-                if count > max_count:
-                    if violation_key not in last_violation_time or \
-                       (current_time - last_violation_time[violation_key]) > VIOLATION_COOLDOWN:
-                        violation = check_violation(vehicle_type, 'in', count)
-                        if violation:
-                            violations.append(violation)
-                            last_violation_time[violation_key] = current_time
-            except KeyError:
-                pass
-        
-        traffic_data.thresholds_crossed = violations
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            while True:
+                chunk = upload_stream.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+            
+            f.flush()
+            os.fsync(f.fileno())
         
+        os.replace(tmp_path, video_path)
+    except BaseException:
         try:
-            stats = traffic_data.get_current_stats()
-            socketio.emit('stats_update', stats)
-        except:
+            os.unlink(tmp_path)
+        except OSError:
             pass
-        
-        time.sleep(current_rate)
-
-
-data_thread = threading.Thread(target=background_data_updater, daemon=True)
-data_thread.start()
+        raise
+    
+    return size, digest.hexdigest()
 
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+def read_file_ranges(video_file, parts, closing=b''):
+    with video_file:
+        for start, end, part_header in parts:
+            if part_header:
+                yield part_header
+            
+            video_file.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                data = video_file.read(min(VIDEO_CHUNK_SIZE, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+        
+        if closing:
+            yield closing
 
 
 def generate_placeholder_frame():
+    from PIL import Image, ImageDraw, ImageFont
+    
     img = Image.new('RGB', (640, 480), color=(30, 30, 50))
     draw = ImageDraw.Draw(img)
     
@@ -669,14 +2040,29 @@ def generate_placeholder_frame():
     return buffer.getvalue()
 
 
+placeholder_frame_bytes = None
+
+
+def get_placeholder_frame():
+    global placeholder_frame_bytes
+    if placeholder_frame_bytes is None:
+        placeholder_frame_bytes = generate_placeholder_frame()
+    return placeholder_frame_bytes
+
+
 @socketio.on('connect')
 def handle_connect():
     print('Client connected')
+    join_room(stats_broadcaster.all_room)
+    alarm_broadcaster.add_client(request.sid)
     emit('stats_update', traffic_data.get_current_stats())
 
 
 @socketio.on('disconnect')
 def handle_disconnect():
+    for stream in stream_registry.list_streams():
+        stream.stats_broadcaster.unsubscribe(request.sid)
+    alarm_broadcaster.remove_client(request.sid)
     print('Client disconnected')
 
 
@@ -685,6 +2071,92 @@ def handle_request_stats():
     emit('stats_update', traffic_data.get_current_stats())
 
 
+@socketio.on('subscribe_stats')
+def handle_subscribe_stats(data=None):
+    data = data or {}
+    stream = stream_registry.get(data.get('stream_id', DEFAULT_STREAM_ID))
+    if stream is None:
+        emit('stats_error', {'message': f"Unknown stream: {data.get('stream_id')}"})
+        return
+    
+    broadcaster = stream.stats_broadcaster
+    sections = broadcaster.resolve_sections(data)
+    previous = broadcaster.subscribe(request.sid, sections)
+    
+    # the full-stats room only belongs to the default stream; subscribing to
+    # another stream leaves the default feed untouched
+    if stream is default_stream:
+        leave_room(stats_broadcaster.all_room)
+    for name in previous:
+        leave_room(broadcaster.room(name))
+    for name in sections:
+        join_room(broadcaster.room(name))
+    
+    emit('stats_snapshot', broadcaster.snapshot(request.sid))
+
+
+@socketio.on('unsubscribe_stats')
+def handle_unsubscribe_stats(data=None):
+    data = data or {}
+    stream = stream_registry.get(data.get('stream_id', DEFAULT_STREAM_ID))
+    if stream is None:
+        return
+    
+    for name in stream.stats_broadcaster.unsubscribe(request.sid):
+        leave_room(stream.stats_broadcaster.room(name))
+    if stream is default_stream:
+        join_room(stats_broadcaster.all_room)
+
+
+@socketio.on('resync_stats')
+def handle_resync_stats(data=None):
+    data = data or {}
+    stream = stream_registry.get(data.get('stream_id', DEFAULT_STREAM_ID))
+    if stream is None:
+        emit('stats_error', {'message': f"Unknown stream: {data.get('stream_id')}"})
+        return
+    
+    emit('stats_snapshot', stream.stats_broadcaster.snapshot(request.sid))
+
+
+def stream_not_found(stream_id):
+    return jsonify({
+        'status': 'error',
+        'message': f'Stream {stream_id} not found'
+    }), 404
+
+
+def alarms_loading():
+    return jsonify({
+        'status': 'error',
+        'message': 'Alarm history is still loading'
+    }), 503
+
+
+@app.route('/healthz')
+def healthz():
+    ready = alarms_ready.is_set()
+    failed = startup_report.failed()
+    return jsonify({
+        'status': ('degraded' if failed else 'ok') if ready else 'starting',
+        'ready': ready,
+        'uptime_seconds': round(time.perf_counter() - startup_report.started, 3),
+        'startup': startup_report.snapshot(),
+        'failed': failed
+    })
+
+
+@app.route('/readyz')
+def readyz():
+    if not alarms_ready.is_set():
+        return jsonify({'status': 'starting', 'ready': False}), 503
+    
+    failed = startup_report.failed()
+    if failed:
+        return jsonify({'status': 'degraded', 'ready': True, 'failed': failed})
+    return jsonify({'status': 'ok', 'ready': True})
+
+
 @app.route('/')
 def index():
     with polling_rate_lock:
@@ -695,75 +2167,142 @@ def index():
         'message': 'Traffic Monitoring Backend with Socket.IO',
         'version': '2.0',
         'port': 5001,
-        'video_uploaded': current_video_data is not None,
+        'video_uploaded': default_stream.video is not None,
         'polling_rate_seconds': current_rate,
-        'socket_io_enabled': True
+        'socket_io_enabled': True,
+        'streams': len(stream_registry.list_streams())
     })
 
 
-@app.route('/video_feed')
-def video_feed():
-    global current_video_data, current_video_mimetype
+@app.route('/video_feed', defaults={'stream_id': DEFAULT_STREAM_ID})
+@app.route('/video_feed/<stream_id>')
+def video_feed(stream_id):
+    stream = stream_registry.get(stream_id)
+    if stream is None:
+        return stream_not_found(stream_id)
     
-    if current_video_data is None:
+    video = stream.video
+    
+    if video is None:
         def generate_placeholder():
             while True:
-                frame_bytes = generate_placeholder_frame()
+                frame_bytes = get_placeholder_frame()
                 yield (b'--frame\r\n'
                        b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
                 time.sleep(0.1)
         
         return Response(generate_placeholder(), mimetype='multipart/x-mixed-replace; boundary=frame')
     
-    def send_video():
-        chunk_size = 1024 * 1024
-        video_stream = io.BytesIO(current_video_data)
-        data = video_stream.read(chunk_size)
-        while data:
-            yield data
-            data = video_stream.read(chunk_size)
-    
-    return Response(
-        send_video(),
-        mimetype=current_video_mimetype,
-        headers={
-            'Content-Disposition': 'inline',
-            'Accept-Ranges': 'bytes'
-        }
-    )
+    headers = {
+        'Content-Disposition': 'inline',
+        'Accept-Ranges': 'bytes'
+    }
+    
+    if request.if_none_match.contains_weak(video['etag']):
+        response = Response(status=304, headers=headers)
+        response.set_etag(video['etag'])
+        return response
+    
+    size = video['size']
+    ranges = None
+    if_range = request.if_range
+    if if_range.date is None and if_range.etag in (None, video['etag']):
+        ranges = parse_byte_ranges(request.headers.get('Range'), size)
+    
+    if ranges is not None and len(ranges) == 0:
+        headers['Content-Range'] = f'bytes */{size}'
+        return Response(status=416, headers=headers)
+    
+    video_file = open(video['path'], 'rb')
+    
+    if not ranges:
+        response = Response(
+            wrap_file(request.environ, video_file, VIDEO_CHUNK_SIZE),
+            mimetype=video['mimetype'],
+            headers=headers,
+            direct_passthrough=True
+        )
+        response.content_length = size
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response = Response(
+            read_file_ranges(video_file, [(start, end, b'')]),
+            status=206,
+            mimetype=video['mimetype'],
+            headers=headers,
+            direct_passthrough=True
+        )
+        response.content_length = end - start + 1
+    else:
+        boundary = os.urandom(12).hex()
+        parts = []
+        content_length = 0
+        for start, end in ranges:
+            part_header = (f'\r\n--{boundary}\r\n'
+                           f'Content-Type: {video["mimetype"]}\r\n'
+                           f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n').encode()
+            parts.append((start, end, part_header))
+            content_length += len(part_header) + end - start + 1
+        closing = f'\r\n--{boundary}--\r\n'.encode()
+        content_length += len(closing)
+        
+        response = Response(
+            read_file_ranges(video_file, parts, closing),
+            status=206,
+            mimetype=f'multipart/byteranges; boundary={boundary}',
+            headers=headers,
+            direct_passthrough=True
+        )
+        response.content_length = content_length
+    
+    response.set_etag(video['etag'])
+    return response
 
 
-@app.route('/processed_feed')
-def processed_feed():
+@app.route('/processed_feed', defaults={'stream_id': DEFAULT_STREAM_ID})
+@app.route('/processed_feed/<stream_id>')
+def processed_feed(stream_id):
+    stream = stream_registry.get(stream_id)
+    if stream is None:
+        return stream_not_found(stream_id)
+    
+    broadcaster = stream.frame_broadcaster
+    key = broadcaster.variant_key(
+        request.args.get('width', type=int),
+        request.args.get('quality', type=int)
+    )
+    
+    fps = request.args.get('fps', type=float)
+    if fps is not None and fps > 0:
+        min_interval = 1.0 / max(MIN_VARIANT_FPS, min(MAX_VARIANT_FPS, fps))
+    else:
+        min_interval = 0.0
+    
+    if not broadcaster.subscribe(key):
+        return jsonify({
+            'status': 'error',
+            'message': f'Too many concurrent stream variants (max {MAX_FRAME_VARIANTS})'
+        }), 503
+    
     def generate_frames():
+        last_seq = None
+        last_sent = 0.0
         while True:
-            try:
-                frame = video_processor.get_current_frame()
-                
-                if frame is None:
-                    placeholder_bytes = generate_placeholder_frame()
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + placeholder_bytes + b'\r\n')
-                    time.sleep(0.1)
-                    continue
-                
-                ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-                
-                if not ret:
-                    continue
-                
-                frame_bytes = buffer.tobytes()
-                
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-                
-            except Exception as e:
-                print(f"Frame streaming error: {e}")
-                time.sleep(0.1)
+            if min_interval:
+                delay = last_sent + min_interval - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            
+            seq, frame_bytes = broadcaster.wait_for_frame(key, last_seq)
+            if frame_bytes is None:
+                continue
             
-            time.sleep(0.033)
+            last_seq = seq
+            last_sent = time.time()
+            yield frame_bytes
     
-    return Response(
+    response = Response(
         generate_frames(),
         mimetype='multipart/x-mixed-replace; boundary=frame',
         headers={
@@ -772,14 +2311,24 @@ def processed_feed():
             'Expires': '0'
         }
     )
+    # unsubscribe even if the client disconnects before the first frame is pulled
+    response.call_on_close(lambda: broadcaster.unsubscribe(key))
+    return response
 
 
-@app.route('/api/upload-video', methods=['POST'])
-def upload_video():
-    global current_video_data, current_video_mimetype
-    
+@app.route('/api/upload-video', methods=['POST'], defaults={'stream_id': DEFAULT_STREAM_ID})
+@app.route('/api/streams/<stream_id>/upload-video', methods=['POST'])
+def upload_video(stream_id):
+    stream = None
+    created = False
     try:
-        print("\nReceiving video upload...")
+        print(f"\nReceiving video upload for stream {stream_id}...")
+        
+        if not STREAM_ID_PATTERN.match(stream_id):
+            return jsonify({
+                'status': 'error',
+                'message': 'Invalid stream ID'
+            }), 400
         
         if 'video' not in request.files:
             return jsonify({
@@ -801,8 +2350,6 @@ def upload_video():
                 'message': f'Invalid file type'
             }), 400
         
-        current_video_data = video_file.read()
-        
         file_extension = video_file.filename.rsplit('.', 1)[1].lower()
         mime_types = {
             'mp4': 'video/mp4',
@@ -811,29 +2358,45 @@ def upload_video():
             'mkv': 'video/x-matroska',
             'webm': 'video/webm'
         }
-        current_video_mimetype = mime_types.get(file_extension, 'video/mp4')
+        video_mimetype = mime_types.get(file_extension, 'video/mp4')
+        
+        # only a valid upload may register a stream and take one of MAX_STREAMS
+        created = stream_registry.get(stream_id) is None
+        stream = stream_registry.get_or_create(stream_id)
+        if stream is None:
+            return jsonify({
+                'status': 'error',
+                'message': f'Stream limit reached ({MAX_STREAMS})'
+            }), 503
         
-        video_path = 'temp_video.mp4'
-        with open(video_path, 'wb') as f:
-            f.write(current_video_data)
+        video_path = stream.video_path
+        video_size, video_hash = save_upload_stream(video_file.stream, video_path)
         print(f"Video saved to: {video_path}")
         
-        traffic_data.reset_stats()
-        traffic_data.start_processing()
-        video_processor.start_processing(video_path)
+        stream.video = {
+            'path': video_path,
+            'mimetype': video_mimetype,
+            'size': video_size,
+            'etag': video_hash
+        }
+        
+        stream.video_processor.stop_processing()
+        stream.traffic_data.reset_stats()
+        stream.traffic_data.start_processing()
+        stream.video_processor.start_processing(video_path)
         
-        video_size_mb = len(current_video_data) / (1024 * 1024)
+        video_size_mb = video_size / (1024 * 1024)
         
         with polling_rate_lock:
             current_rate = backend_polling_rate
         
-        print(f"Video loaded into memory")
         print(f"Size: {video_size_mb:.2f} MB")
-        print(f"Type: {current_video_mimetype}")
+        print(f"Type: {video_mimetype}")
         print(f"Video processing started")
         print(f"Backend polling rate: {current_rate}s\n")
         
         socketio.emit('video_uploaded', {
+            'stream_id': stream_id,
             'filename': video_file.filename,
             'size_mb': round(video_size_mb, 2)
         })
@@ -842,6 +2405,7 @@ def upload_video():
             'status': 'success',
             'message': 'Video uploaded successfully',
             'data': {
+                'stream_id': stream_id,
                 'video_size_mb': round(video_size_mb, 2),
                 'processing_status': 'Video uploaded - monitoring started',
                 'polling_rate_seconds': current_rate
@@ -850,15 +2414,27 @@ def upload_video():
         
     except Exception as e:
         print(f"Upload failed: {str(e)}\n")
+        if created and stream is not None and stream.video is None:
+            stream_registry.remove(stream_id)
         return jsonify({
             'status': 'error',
             'message': f'Upload failed: {str(e)}'
         }), 500
 
 
-@app.route('/api/stats/current', methods=['GET'])
-def get_current_stats():
-    stats = traffic_data.get_current_stats()
+@app.route('/api/stats/current', methods=['GET'], defaults={'stream_id': DEFAULT_STREAM_ID})
+@app.route('/api/streams/<stream_id>/stats', methods=['GET'])
+def get_current_stats(stream_id):
+    stream = stream_registry.get(stream_id)
+    if stream is None:
+        return stream_not_found(stream_id)
+    
+    stats = stream.traffic_data.get_current_stats()
+    if stream.has_pipeline:
+        stats['pipeline'] = stream.video_processor.get_pipeline_stats()
+        stats['pipeline']['variants'] = stream.frame_broadcaster.get_variants()
+    else:
+        stats['pipeline'] = {'variants': []}
     
     with polling_rate_lock:
         stats['backend_polling_rate'] = backend_polling_rate
@@ -866,15 +2442,64 @@ def get_current_stats():
     return jsonify(stats)
 
 
-@app.route('/api/stats/reset', methods=['POST'])
-def reset_stats():
-    global current_video_data
-    traffic_data.reset_stats()
-    current_video_data = None
+def parse_history_time(value, default):
+    if value is None or value == '':
+        return default
+    try:
+        timestamp = float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+    
+    if not math.isfinite(timestamp):
+        raise ValueError(f'{value} is not a valid time')
+    return timestamp
+
+
+@app.route('/api/stats/history', methods=['GET'], defaults={'stream_id': DEFAULT_STREAM_ID})
+@app.route('/api/streams/<stream_id>/stats/history', methods=['GET'])
+def get_stats_history(stream_id):
+    stream = stream_registry.get(stream_id)
+    if stream is None:
+        return stream_not_found(stream_id)
+    
+    args = request.args
+    try:
+        end = parse_history_time(args.get('to'), time.time())
+        start = parse_history_time(args.get('from'), end - 3600)
+        if end <= start:
+            raise ValueError('to must be later than from')
+        
+        step = float(args['step']) if args.get('step') else max(1.0, (end - start) / DEFAULT_HISTORY_POINTS)
+        if not math.isfinite(step) or step <= 0:
+            raise ValueError('step must be a positive number of seconds')
+        
+        history = stream.traffic_data.history.query(start, end, step)
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'Invalid history query: {e}'
+        }), 400
+    
+    return jsonify({
+        'status': 'success',
+        'stream_id': stream_id,
+        **history
+    })
+
+
+@app.route('/api/stats/reset', methods=['POST'], defaults={'stream_id': DEFAULT_STREAM_ID})
+@app.route('/api/streams/<stream_id>/stats/reset', methods=['POST'])
+def reset_stats(stream_id):
+    stream = stream_registry.get(stream_id)
+    if stream is None:
+        return stream_not_found(stream_id)
+    
+    stream.traffic_data.reset_stats()
+    stream.video = None
     return jsonify({
         'status': 'success',
         'message': 'Statistics and alarms reset successfully',
-        'data': traffic_data.get_current_stats()
+        'data': stream.traffic_data.get_current_stats()
     })
 
 
@@ -888,7 +2513,6 @@ def get_thresholds():
 
 @app.route('/api/thresholds', methods=['POST'])
 def update_thresholds():
-    global current_thresholds
     try:
         data = request.get_json()
         new_thresholds = data.get('thresholds')
@@ -899,10 +2523,7 @@ def update_thresholds():
                 'message': 'No thresholds provided'
             }), 400
         
-        required_lanes = ['out', 'in']
-        required_vehicles = ['2WHLR', 'LMV', 'HMV']
-        
-        for lane in required_lanes:
+        for lane in THRESHOLD_LANES:
             if lane not in new_thresholds:
                 return jsonify({
                     'status': 'error',
@@ -915,7 +2536,14 @@ def update_thresholds():
                     'message': f'Missing time_period for {lane} lane'
                 }), 400
             
-            for vehicle in required_vehicles:
+            time_period = new_thresholds[lane]['time_period']
+            if not isinstance(time_period, (int, float)) or time_period <= 0 or time_period > MAX_WINDOW_MINUTES:
+                return jsonify({
+                    'status': 'error',
+                    'message': f'Invalid time_period for {lane} lane. Must be between 0 and {MAX_WINDOW_MINUTES} minutes.'
+                }), 400
+            
+            for vehicle in VEHICLE_TYPES:
                 if vehicle not in new_thresholds[lane]:
                     return jsonify({
                         'status': 'error',
@@ -928,7 +2556,13 @@ def update_thresholds():
                         'message': f'Missing max_count for {vehicle} in {lane} lane'
                     }), 400
         
-        current_thresholds = new_thresholds
+        try:
+            install_thresholds(new_thresholds)
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
         save_thresholds()
         
         socketio.emit('threshold_updated', current_thresholds)
@@ -948,6 +2582,107 @@ def update_thresholds():
         }), 500
 
 
+@app.route('/metrics')
+def metrics():
+    writer = MetricsWriter()
+    streams = [stream for stream in stream_registry.list_streams() if stream.has_pipeline]
+    
+    stage_series = []
+    dropped_series = []
+    for stream in streams:
+        labels = {'stream': stream.stream_id}
+        histograms = stream.video_processor.get_stage_histograms()
+        histograms['encode'] = stream.frame_broadcaster.encode_stats.histogram.snapshot()
+        for stage, snapshot in histograms.items():
+            stage_series.append((dict(labels, stage=stage), snapshot))
+        
+        pipeline = stream.video_processor.get_pipeline_stats()
+        for stage in ('decode', 'annotate', 'publish'):
+            if stage in pipeline:
+                dropped_series.append((dict(labels, stage=stage), pipeline[stage]['dropped']))
+    
+    writer.histogram('video_frame_stage_seconds',
+                     'Per-frame time spent in each video pipeline stage.', stage_series)
+    writer.counter('video_frames_dropped_total',
+                   'Frames dropped by each pipeline stage since processing started.', dropped_series)
+    
+    writer.gauge('processed_feed_subscribers', 'Clients connected to /processed_feed.',
+                 [({'stream': s.stream_id}, s.frame_broadcaster.subscribers) for s in streams])
+    writer.counter('processed_feed_frames_sent_total', 'Frames handed to /processed_feed clients.',
+                   [({'stream': s.stream_id}, s.frame_broadcaster.frames_sent) for s in streams])
+    writer.counter('processed_feed_bytes_sent_total', 'Bytes handed to /processed_feed clients.',
+                   [({'stream': s.stream_id}, s.frame_broadcaster.bytes_sent) for s in streams])
+    
+    writer.gauge('startup_phase_seconds', 'Time taken by each startup phase.',
+                 [({'phase': phase['phase']}, round(phase['ms'] / 1000, 4)) for phase in startup_report.snapshot()])
+    
+    managers = [alarm_manager] if alarm_manager is not None else []
+    writer.histogram('alarm_add_seconds', 'AlarmManager.add_alarm latency including lock wait.',
+                     [({}, manager.add_latency.snapshot()) for manager in managers])
+    writer.histogram('alarm_lock_wait_seconds', 'Time add_alarm waited for the alarm store lock.',
+                     [({}, manager.lock_wait.snapshot()) for manager in managers])
+    writer.histogram('alarm_save_seconds', 'AlarmManager.save_alarms latency.',
+                     [({}, manager.save_latency.snapshot()) for manager in managers])
+    writer.gauge('alarm_broadcast_clients', 'Socket.IO clients receiving alarms_batch events.',
+                 [({}, len(alarm_broadcaster.clients))])
+    writer.counter('alarm_broadcast_batches_total', 'alarms_batch events emitted.',
+                   [({}, alarm_broadcaster.batches_sent)])
+    writer.counter('alarm_broadcast_dropped_total',
+                   'Alarms a client missed because they left the bounded queue before delivery.',
+                   [({}, alarm_broadcaster.dropped)])
+    
+    writer.histogram('updater_tick_seconds', 'Duration of one background_data_updater pass.',
+                     [({}, updater_tick_seconds.snapshot())])
+    writer.histogram('updater_drift_seconds', 'How late each background_data_updater pass started.',
+                     [({}, updater_drift_seconds.snapshot())])
+    
+    writer.counter('socketio_emits_total', 'Socket.IO events emitted by the server.',
+                   [({'event': event}, count) for event, count in sorted(socket_emits.snapshot().items())])
+    
+    return Response(writer.render(), content_type=CONTENT_TYPE)
+
+
+@app.route('/api/counting-lines', methods=['GET'], defaults={'stream_id': DEFAULT_STREAM_ID})
+@app.route('/api/streams/<stream_id>/counting-lines', methods=['GET'])
+def get_counting_lines(stream_id):
+    stream = stream_registry.get(stream_id)
+    if stream is None:
+        return stream_not_found(stream_id)
+    
+    return jsonify({
+        'status': 'success',
+        'stream_id': stream_id,
+        'lines': stream.counting_lines
+    })
+
+
+@app.route('/api/counting-lines', methods=['POST'], defaults={'stream_id': DEFAULT_STREAM_ID})
+@app.route('/api/streams/<stream_id>/counting-lines', methods=['POST'])
+def update_counting_lines(stream_id):
+    stream = stream_registry.get(stream_id)
+    if stream is None:
+        return stream_not_found(stream_id)
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        lines = validate_counting_lines(data.get('lines'))
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    
+    stream.set_counting_lines(lines)
+    print(f"Counting lines updated for stream {stream_id}: {len(lines)} line(s)")
+    
+    return jsonify({
+        'status': 'success',
+        'message': 'Counting lines updated successfully',
+        'stream_id': stream_id,
+        'lines': lines
+    })
+
+
 @app.route('/api/polling-rate', methods=['POST'])
 def update_polling_rate():
     global backend_polling_rate
@@ -999,25 +2734,167 @@ def get_polling_rate():
     }), 200
 
 
-@app.route('/api/stop-processing', methods=['POST'])
-def stop_processing():
-    global current_video_data
-    traffic_data.stop_processing()
-    video_processor.stop_processing()
-    current_video_data = None
+@app.route('/api/stop-processing', methods=['POST'], defaults={'stream_id': DEFAULT_STREAM_ID})
+@app.route('/api/streams/<stream_id>/stop-processing', methods=['POST'])
+def stop_processing(stream_id):
+    stream = stream_registry.get(stream_id)
+    if stream is None:
+        return stream_not_found(stream_id)
+    
+    stream.stop()
     return jsonify({'status': 'success', 'message': 'Processing stopped'})
 
 
+@app.route('/api/streams', methods=['GET'])
+def list_streams():
+    streams = stream_registry.list_streams()
+    return jsonify({
+        'status': 'success',
+        'total': len(streams),
+        'max_streams': MAX_STREAMS,
+        'max_concurrent_decoders': MAX_CONCURRENT_DECODERS,
+        'streams': [stream.describe() for stream in streams]
+    })
+
+
+@app.route('/api/streams', methods=['POST'])
+def create_stream():
+    data = request.get_json(silent=True) or {}
+    stream_id = data.get('stream_id')
+    
+    if not stream_id or not STREAM_ID_PATTERN.match(stream_id):
+        return jsonify({
+            'status': 'error',
+            'message': 'Invalid stream ID'
+        }), 400
+    
+    stream = stream_registry.get_or_create(stream_id)
+    if stream is None:
+        return jsonify({
+            'status': 'error',
+            'message': f'Stream limit reached ({MAX_STREAMS})'
+        }), 503
+    
+    return jsonify({
+        'status': 'success',
+        'stream': stream.describe()
+    })
+
+
+@app.route('/api/streams/<stream_id>', methods=['DELETE'])
+def delete_stream(stream_id):
+    if stream_id == DEFAULT_STREAM_ID:
+        return jsonify({
+            'status': 'error',
+            'message': 'The default stream cannot be removed'
+        }), 400
+    
+    if not stream_registry.remove(stream_id):
+        return stream_not_found(stream_id)
+    
+    return jsonify({
+        'status': 'success',
+        'message': f'Stream {stream_id} removed'
+    })
+
+
 @app.route('/api/alarms', methods=['GET'])
 def get_alarms():
+    if alarm_manager is None:
+        return alarms_loading()
+    
     try:
-        alarms = alarm_manager.get_all_alarms()
-        return jsonify({
+        args = request.args
+        
+        etag = alarm_manager.get_etag(request.query_string)
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+        
+        try:
+            limit = args.get('limit', type=int)
+            if limit is not None:
+                limit = max(1, min(limit, MAX_ALARM_PAGE_SIZE))
+            
+            descending = args.get('order', 'asc') == 'desc'
+            after_id = None
+            before_id = None
+            
+            if args.get('since_id'):
+                after_id = alarm_number(args['since_id'])
+            if args.get('cursor'):
+                cursor = alarm_number(args['cursor'])
+                if descending:
+                    before_id = cursor
+                else:
+                    after_id = max(after_id or 0, cursor)
+        except ValueError:
+            return jsonify({
+                'status': 'error',
+                'message': 'Invalid limit, cursor or since_id'
+            }), 400
+        
+        query_method = alarm_manager.query_alarms
+        if args.get('archived', 'false').lower() in ('1', 'true', 'yes'):
+            query_method = alarm_manager.query_with_archive
+        
+        alarms = query_method(
+            status=args.get('status'),
+            lane=args.get('lane'),
+            alarm_type=args.get('type'),
+            vehicle_type=args.get('vehicle_type'),
+            since=args.get('from'),
+            until=args.get('to'),
+            after_id=after_id,
+            before_id=before_id,
+            limit=limit + 1 if limit is not None else None,
+            descending=descending
+        )
+        
+        next_cursor = None
+        if limit is not None and len(alarms) > limit:
+            alarms = alarms[:limit]
+            next_cursor = alarms[-1]['id']
+        
+        response = jsonify({
             'status': 'success',
-            'total': len(alarms),
+            'total': alarm_manager.get_total_count(),
             'active': alarm_manager.get_active_count(),
+            'archived': alarm_manager.archive.count,
+            'count': len(alarms),
+            'next_cursor': next_cursor,
+            'latest_id': alarm_manager.get_latest_id(),
             'alarms': alarms
         })
+        response.set_etag(etag)
+        return response
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+
+@app.route('/api/alarms/counts', methods=['GET'])
+def get_alarm_counts():
+    if alarm_manager is None:
+        return alarms_loading()
+    
+    try:
+        counts = {}
+        for field in AlarmManager.INDEXED_FIELDS:
+            # alarms without the field (e.g. no vehicle type) are counted as unknown
+            counts[field] = {
+                'unknown' if value is None else value: count
+                for value, count in alarm_manager.get_counts_by(field).items()
+            }
+        
+        return jsonify({
+            'status': 'success',
+            'total': alarm_manager.get_total_count(),
+            'counts': counts
+        })
     except Exception as e:
         return jsonify({
             'status': 'error',
@@ -1025,8 +2902,29 @@ def get_alarms():
         }), 500
 
 
+@app.route('/api/alarms/<alarm_id>', methods=['GET'])
+def get_alarm(alarm_id):
+    if alarm_manager is None:
+        return alarms_loading()
+    
+    alarm = alarm_manager.get_alarm(alarm_id)
+    if alarm is None:
+        return jsonify({
+            'status': 'error',
+            'message': f'Alarm {alarm_id} not found'
+        }), 404
+    
+    return jsonify({
+        'status': 'success',
+        'alarm': alarm
+    })
+
+
 @app.route('/api/alarms/clear', methods=['POST'])
 def clear_alarms():
+    if alarm_manager is None:
+        return alarms_loading()
+    
     try:
         data = request.json
         alarm_ids = data.get('alarm_ids', [])
@@ -1053,6 +2951,9 @@ def clear_alarms():
 
 @app.route('/api/alarms/reset', methods=['POST'])
 def reset_alarms_route():
+    if alarm_manager is None:
+        return alarms_loading()
+    
     try:
         alarm_manager.reset_alarms()
         return jsonify({
@@ -1068,6 +2969,9 @@ def reset_alarms_route():
 
 @app.route('/api/alarms/add-test', methods=['GET', 'POST'])
 def add_test_alarms():
+    if alarm_manager is None:
+        return alarms_loading()
+    
     try:
         alarm_manager.add_alarm('over_speeding', 'OUT', speed=85, vehicle_type='LMV')
         alarm_manager.add_alarm('wrong_lane', 'IN', vehicle_type='2WHLR')
@@ -1078,7 +2982,7 @@ def add_test_alarms():
         return jsonify({
             'status': 'success',
             'message': '5 test alarms added',
-            'total': len(alarm_manager.get_all_alarms())
+            'total': alarm_manager.get_total_count()
         })
     except Exception as e:
         return jsonify({
@@ -1089,6 +2993,9 @@ def add_test_alarms():
 
 @app.route('/api/alarms/delete/<alarm_id>', methods=['DELETE'])
 def delete_alarm(alarm_id):
+    if alarm_manager is None:
+        return alarms_loading()
+    
     try:
         deleted = alarm_manager.delete_alarm(alarm_id)
         
@@ -1111,6 +3018,9 @@ def delete_alarm(alarm_id):
 
 @app.route('/api/alarms/delete-all', methods=['DELETE'])
 def delete_all_alarms():
+    if alarm_manager is None:
+        return alarms_loading()
+    
     try:
         count = alarm_manager.delete_all_alarms()
         
@@ -1127,8 +3037,12 @@ def delete_all_alarms():
 
 
 if __name__ == '__main__':
-    load_thresholds()
+    create_app()
+    
+    if SERVER_MODE == 'gevent' and VIDEO_PROCESS_MODE != 'process':
+        print("Warning: in-process video pipeline threads will block the gevent hub; use VIDEO_PROCESS_MODE=process")
     
+    print(f"Server mode: {SERVER_MODE}")
     print(f"Backend polling rate: {backend_polling_rate} seconds")
     print(f"Socket.IO enabled")
     print(f"Total formula: Incoming - Outgoing\n")
@@ -0,0 +1,450 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+
+VEHICLE_TYPES = ('2WHLR', 'LMV', 'HMV')
+BENCHMARKS = ('alarms', 'stats', 'video', 'fanout', 'upload')
+FULL_DEFAULTS = {
+    'alarm_sizes': '10000,100000,1000000',
+    'video_frames': 300,
+    'viewers': '1,10,100',
+    'fanout_seconds': 3.0,
+    'upload_mb': 100,
+    'stats_iterations': 5000
+}
+QUICK_DEFAULTS = {
+    'alarm_sizes': '10000',
+    'video_frames': 100,
+    'viewers': '1,10',
+    'fanout_seconds': 1.0,
+    'upload_mb': 20,
+    'stats_iterations': 1000
+}
+
+# metric name suffix -> True when a larger value is better
+METRIC_DIRECTIONS = {
+    '_per_sec': True,
+    '_fps': True,
+    '_ms': False,
+    '_us': False,
+    '_mb': False,
+    '_seconds': False
+}
+
+
+@contextlib.contextmanager
+def quiet():
+    # the app prints on every alarm and frame; keep that out of the timings
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def make_synthetic_video(path, width=1280, height=720, frames=300, fps=30, seed=0):
+    rng = np.random.default_rng(seed)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    background = rng.integers(60, 90, (height, width, 3), dtype=np.uint8)
+    
+    # (size as a fraction of the frame, horizontal speed in px/frame, row)
+    vehicles = [((0.03, 0.04), 9, 0.2), ((0.09, 0.1), 6, 0.48), ((0.2, 0.18), 4, 0.72)]
+    
+    for index in range(frames):
+        frame = background.copy()
+        for number, ((box_width, box_height), speed, row) in enumerate(vehicles):
+            w, h = int(box_width * width), int(box_height * height)
+            x = int((index * speed + number * width // 4) % (width + w)) - w
+            y = int(row * height)
+            cv2.rectangle(frame, (x, y), (x + w, y + h), (200, 200 - 60 * number, 50 + 60 * number), -1)
+        frame = cv2.add(frame, rng.integers(0, 6, (height, width, 3), dtype=np.uint8))
+        writer.write(frame)
+    
+    writer.release()
+    return path
+
+
+def bench_alarms(app, workdir, size, backend):
+    directory = os.path.join(workdir, f'alarms-{backend}-{size}')
+    os.makedirs(directory, exist_ok=True)
+    os.chdir(directory)
+    
+    with quiet():
+        if backend == 'sqlite':
+            manager = app.SQLiteAlarmManager(os.path.join(directory, 'alarm_history.db'))
+        else:
+            manager = app.AlarmManager()
+        manager.delete_all_alarms()
+        
+        start = time.perf_counter()
+        for index in range(size):
+            manager.add_alarm(
+                'threshold_exceeded',
+                'in' if index % 2 else 'out',
+                vehicle_type=VEHICLE_TYPES[index % 3],
+                count=index,
+                max_count=10
+            )
+        add_seconds = time.perf_counter() - start
+        
+        repeat = 3
+        start = time.perf_counter()
+        for _ in range(repeat):
+            active = manager.get_active_alarms()
+        get_active_seconds = (time.perf_counter() - start) / repeat
+        
+        pages = 200
+        start = time.perf_counter()
+        for _ in range(pages):
+            manager.query_alarms(status='active', lane='IN', limit=100, descending=True)
+        query_page_seconds = (time.perf_counter() - start) / pages
+        
+        ids = [alarm['id'] for alarm in active]
+        start = time.perf_counter()
+        manager.clear_alarms(ids)
+        clear_seconds = time.perf_counter() - start
+    
+    return {
+        'alarms': size,
+        'add_per_sec': round(size / add_seconds, 1),
+        'get_active_ms': round(get_active_seconds * 1000, 3),
+        'query_page_us': round(query_page_seconds * 1e6, 1),
+        'clear_ms': round(clear_seconds * 1000, 3)
+    }
+
+
+def bench_stats(app, iterations):
+    simulator = app.TrafficDataSimulator()
+    simulator.is_processing = True
+    broadcaster = app.StatsBroadcaster('benchmark')
+    
+    with quiet():
+        for _ in range(100):
+            simulator.update_counts()
+        stats = simulator.get_current_stats()
+        
+        start = time.perf_counter()
+        for _ in range(iterations):
+            payload = json.dumps(stats)
+        serialize_seconds = (time.perf_counter() - start) / iterations
+        
+        start = time.perf_counter()
+        for _ in range(iterations):
+            simulator.update_counts()
+            broadcaster.publish(simulator.get_current_stats())
+        publish_seconds = (time.perf_counter() - start) / iterations
+    
+    return {
+        'payload_bytes': len(payload),
+        'serialize_us': round(serialize_seconds * 1e6, 2),
+        'update_and_publish_us': round(publish_seconds * 1e6, 2)
+    }
+
+
+def bench_video(video_path, frames, batch_size):
+    from detection import create_detector
+    from video_pipeline import VideoProcessor
+    
+    capture = cv2.VideoCapture(video_path)
+    decoded = []
+    start = time.perf_counter()
+    while len(decoded) < frames:
+        ret, frame = capture.read()
+        if not ret:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            continue
+        decoded.append(frame)
+    decode_seconds = time.perf_counter() - start
+    capture.release()
+    
+    with quiet():
+        processor = VideoProcessor()
+    processor.detector = create_detector('motion')
+    processor.tracker.reset()
+    
+    start = time.perf_counter()
+    for offset in range(0, frames, batch_size):
+        batch = decoded[offset:offset + batch_size]
+        for index, (frame, detections) in enumerate(zip(batch, processor.detector.detect_batch(batch))):
+            tracked = processor._track_detections(detections, frame.shape)
+            processor._draw_detections(frame, tracked, offset + index)
+    annotate_seconds = time.perf_counter() - start
+    
+    decode_fps = frames / decode_seconds
+    annotate_fps = frames / annotate_seconds
+    return {
+        'frames': frames,
+        'resolution': f'{decoded[0].shape[1]}x{decoded[0].shape[0]}',
+        'decode_fps': round(decode_fps, 1),
+        'annotate_fps': round(annotate_fps, 1),
+        'serial_pipeline_fps': round(1.0 / (1.0 / decode_fps + 1.0 / annotate_fps), 1)
+    }
+
+
+class StaticFrameSource:
+    def __init__(self, frame):
+        self.frame = frame
+        self.seq = 0
+    
+    def get_latest_frame(self):
+        self.seq += 1
+        return self.seq, self.frame
+    
+    def is_frame_intact(self, seq):
+        return True
+
+
+def bench_fanout(app, frame, viewers, duration):
+    broadcaster = app.FrameBroadcaster(StaticFrameSource(frame))
+    key = broadcaster.variant_key()
+    
+    start = time.perf_counter()
+    for _ in range(20):
+        broadcaster._encode_variants(frame, [key])
+    encode_seconds = (time.perf_counter() - start) / 20
+    
+    stop = threading.Event()
+    delivered = [0] * viewers
+    
+    def viewer(index):
+        last_seq = None
+        while not stop.is_set():
+            seq, frame_bytes = broadcaster.wait_for_frame(key, last_seq)
+            if frame_bytes is not None and seq != last_seq:
+                delivered[index] += 1
+                last_seq = seq
+    
+    with quiet():
+        for _ in range(viewers):
+            broadcaster.subscribe(key)
+        threads = [threading.Thread(target=viewer, args=(index,), daemon=True) for index in range(viewers)]
+        
+        cpu_start = time.process_time()
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=2)
+        cpu_seconds = time.process_time() - cpu_start
+        
+        for _ in range(viewers):
+            broadcaster.unsubscribe(key)
+    
+    total = max(sum(delivered), 1)
+    return {
+        'viewers': viewers,
+        'encode_ms': round(encode_seconds * 1000, 3),
+        'per_viewer_fps': round(sum(delivered) / viewers / duration, 1),
+        'cpu_per_viewer_frame_us': round(cpu_seconds / total * 1e6, 1)
+    }
+
+
+def bench_upload(app, workdir, video_path, size_mb):
+    directory = os.path.join(workdir, 'upload')
+    os.makedirs(directory, exist_ok=True)
+    os.chdir(directory)
+    
+    upload_path = os.path.join(directory, 'upload.mp4')
+    shutil.copyfile(video_path, upload_path)
+    padding = size_mb * 1024 * 1024 - os.path.getsize(upload_path)
+    if padding > 0:
+        # trailing bytes after the mp4 atoms are ignored by the demuxer
+        with open(upload_path, 'ab') as f:
+            chunk = b'\0' * (1024 * 1024)
+            while padding > 0:
+                f.write(chunk[:padding])
+                padding -= len(chunk)
+    
+    client = app.app.test_client()
+    with quiet():
+        tracemalloc.start()
+        start = time.perf_counter()
+        with open(upload_path, 'rb') as f:
+            response = client.post(
+                '/api/upload-video',
+                data={'video': (f, 'upload.mp4')},
+                content_type='multipart/form-data'
+            )
+        upload_seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        client.post('/api/stop-processing')
+    
+    return {
+        'status_code': response.status_code,
+        'file_bytes': os.path.getsize(upload_path),
+        'upload_seconds': round(upload_seconds, 3),
+        'peak_python_mb': round(peak / (1024 * 1024), 2)
+    }
+
+
+def metric_direction(name):
+    for suffix, higher_is_better in METRIC_DIRECTIONS.items():
+        if name.endswith(suffix):
+            return higher_is_better
+    return None
+
+
+def compare_results(results, baseline, tolerance):
+    rows = []
+    for section, metrics in results.items():
+        baseline_metrics = baseline.get(section, {})
+        for name, value in metrics.items():
+            higher_is_better = metric_direction(name)
+            base = baseline_metrics.get(name)
+            if higher_is_better is None or not isinstance(base, (int, float)) or base == 0:
+                continue
+            
+            change = (value - base) / base
+            worse_by = -change if higher_is_better else change
+            if worse_by > tolerance:
+                status = 'regressed'
+            elif worse_by < -tolerance:
+                status = 'improved'
+            else:
+                status = 'ok'
+            rows.append({
+                'benchmark': section,
+                'metric': name,
+                'baseline': base,
+                'current': value,
+                'change_pct': round(change * 100, 1),
+                'status': status
+            })
+    return rows
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Offline benchmarks for the road monitoring backend.')
+    parser.add_argument('--only', default=','.join(BENCHMARKS),
+                        help=f'comma separated subset of: {", ".join(BENCHMARKS)}')
+    parser.add_argument('--alarm-sizes', help='alarm store sizes to benchmark (default 10000,100000,1000000)')
+    parser.add_argument('--backends', default='json,sqlite', help='alarm storage backends')
+    parser.add_argument('--video-frames', type=int, help='frames decoded by the video benchmark (default 300)')
+    parser.add_argument('--video-size', default='1280x720')
+    parser.add_argument('--viewers', help='viewer counts for the fan-out benchmark (default 1,10,100)')
+    parser.add_argument('--fanout-seconds', type=float, help='seconds per fan-out run (default 3.0)')
+    parser.add_argument('--upload-mb', type=int, help='upload size in MB (default 100)')
+    parser.add_argument('--stats-iterations', type=int, help='stats payloads built (default 5000)')
+    parser.add_argument('--quick', action='store_true',
+                        help='small sizes for a fast smoke run (10k alarms, 100 frames, 20 MB upload); '
+                             'sizes passed explicitly still apply')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help='results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='relative change treated as a regression (default 0.25 = 25%%)')
+    args = parser.parse_args(argv)
+    
+    # sizes left unset fall back to the quick or full defaults
+    defaults = QUICK_DEFAULTS if args.quick else FULL_DEFAULTS
+    for name, value in defaults.items():
+        if getattr(args, name) is None:
+            setattr(args, name, value)
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    selected = [name.strip() for name in args.only.split(',') if name.strip()]
+    unknown = set(selected) - set(BENCHMARKS)
+    if unknown:
+        print(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+        return 2
+    
+    output_path = os.path.abspath(args.output)
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    workdir = tempfile.mkdtemp(prefix='road-monitoring-bench-')
+    original_dir = os.getcwd()
+    
+    # the app opens its data files relative to the working directory
+    os.chdir(workdir)
+    sys.path.insert(0, repo_dir)
+    with quiet():
+        import app
+        app.create_app()
+        # the alarm history loads in the background relative to the working
+        # directory, so let it finish before the benchmarks start changing it
+        app.alarms_ready.wait()
+    
+    width, height = (int(value) for value in args.video_size.split('x'))
+    video_path = make_synthetic_video(os.path.join(workdir, 'synthetic.mp4'), width, height)
+    
+    results = {}
+    try:
+        if 'alarms' in selected:
+            for backend in args.backends.split(','):
+                for size in (int(value) for value in args.alarm_sizes.split(',')):
+                    print(f'alarms: {backend} x {size}')
+                    results[f'alarms.{backend}.{size}'] = bench_alarms(app, workdir, size, backend)
+        
+        if 'stats' in selected:
+            print('stats')
+            results['stats'] = bench_stats(app, args.stats_iterations)
+        
+        if 'video' in selected:
+            print('video')
+            results['video'] = bench_video(video_path, args.video_frames, batch_size=4)
+        
+        if 'fanout' in selected:
+            capture = cv2.VideoCapture(video_path)
+            _, frame = capture.read()
+            capture.release()
+            for viewers in (int(value) for value in args.viewers.split(',')):
+                print(f'fanout: {viewers} viewers')
+                results[f'fanout.{viewers}'] = bench_fanout(app, frame, viewers, args.fanout_seconds)
+        
+        if 'upload' in selected:
+            print(f'upload: {args.upload_mb} MB')
+            results['upload'] = bench_upload(app, workdir, video_path, args.upload_mb)
+    finally:
+        os.chdir(original_dir)
+        shutil.rmtree(workdir, ignore_errors=True)
+    
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+            'args': vars(args)
+        },
+        'results': results
+    }
+    
+    exit_code = 0
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        comparison = compare_results(results, baseline.get('results', {}), args.tolerance)
+        report['comparison'] = comparison
+        
+        for row in comparison:
+            print(f"{row['status']:>9}  {row['benchmark']:<24} {row['metric']:<26} "
+                  f"{row['baseline']:>12} -> {row['current']:>12} ({row['change_pct']:+.1f}%)")
+        if any(row['status'] == 'regressed' for row in comparison):
+            exit_code = 1
+    
+    with open(output_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    
+    print(json.dumps(results, indent=2))
+    print(f'Results written to {output_path}')
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
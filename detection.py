@@ -0,0 +1,156 @@
+import cv2
+import numpy as np
+
+
+VEHICLE_CLASSES = ('2WHLR', 'LMV', 'HMV')
+CLASS_INDEX = {label: index for index, label in enumerate(VEHICLE_CLASSES)}
+CLASS_COLORS = {
+    '2WHLR': (0, 255, 0),
+    'LMV': (255, 0, 0),
+    'HMV': (0, 165, 255)
+}
+
+
+class MotionDetector:
+    FEEDS_COUNTERS = True
+    
+    def __init__(self, process_width=320, history=300, var_threshold=25,
+                 min_area_ratio=0.0015, lmv_area_ratio=0.008, hmv_area_ratio=0.04,
+                 max_area_ratio=0.5):
+        self.process_width = process_width
+        self.history = history
+        self.var_threshold = var_threshold
+        
+        # box area as a fraction of the frame, so thresholds hold at any resolution
+        self.min_area_ratio = min_area_ratio
+        self.lmv_area_ratio = lmv_area_ratio
+        self.hmv_area_ratio = hmv_area_ratio
+        self.max_area_ratio = max_area_ratio
+        
+        self.open_kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+        self.close_kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (7, 7))
+        self.reset()
+    
+    def reset(self):
+        self.subtractor = cv2.createBackgroundSubtractorMOG2(
+            history=self.history,
+            varThreshold=self.var_threshold,
+            detectShadows=True
+        )
+        self.frame_shape = None
+    
+    def classify(self, area_ratio):
+        if area_ratio >= self.hmv_area_ratio:
+            return 'HMV'
+        if area_ratio >= self.lmv_area_ratio:
+            return 'LMV'
+        return '2WHLR'
+    
+    def detect(self, frame):
+        height, width = frame.shape[:2]
+        scale = min(1.0, self.process_width / width)
+        if scale < 1.0:
+            small = cv2.resize(frame, (self.process_width, max(1, round(height * scale))),
+                               interpolation=cv2.INTER_AREA)
+        else:
+            small = frame
+        
+        # the background model is only valid for one resolution; keying it on the
+        # downscaled shape keeps it across processing scale changes upstream
+        if self.frame_shape != small.shape[:2]:
+            if self.frame_shape is not None:
+                self.reset()
+            self.frame_shape = small.shape[:2]
+        
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        gray = cv2.GaussianBlur(gray, (5, 5), 0)
+        mask = self.subtractor.apply(gray)
+        
+        # MOG2 marks shadows as 127; keep only confident foreground
+        cv2.threshold(mask, 200, 255, cv2.THRESH_BINARY, dst=mask)
+        cv2.morphologyEx(mask, cv2.MORPH_OPEN, self.open_kernel, dst=mask)
+        cv2.morphologyEx(mask, cv2.MORPH_CLOSE, self.close_kernel, dst=mask, iterations=2)
+        
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        
+        small_height, small_width = mask.shape
+        frame_area = float(small_height * small_width)
+        inverse_scale = 1.0 / scale
+        
+        detections = []
+        for contour in contours:
+            x, y, box_width, box_height = cv2.boundingRect(contour)
+            area_ratio = box_width * box_height / frame_area
+            if area_ratio < self.min_area_ratio or area_ratio > self.max_area_ratio:
+                continue
+            
+            detections.append((
+                int(x * inverse_scale),
+                int(y * inverse_scale),
+                int((x + box_width) * inverse_scale),
+                int((y + box_height) * inverse_scale),
+                self.classify(area_ratio)
+            ))
+        
+        return detections
+    
+    def detect_batch(self, frames):
+        return [self.detect(frame) for frame in frames]
+
+
+class DummyDetector:
+    FEEDS_COUNTERS = False
+    
+    def __init__(self):
+        self.reset()
+    
+    def reset(self):
+        self.frame_count = 0
+    
+    def detect(self, frame):
+        self.frame_count += 1
+        frame_count = self.frame_count
+        h, w = frame.shape[:2]
+        
+        x1 = int((frame_count * 5) % max(w - 100, 1))
+        y1 = int(h * 0.3)
+        x2 = int((frame_count * 3) % max(w - 150, 1))
+        y2 = int(h * 0.5)
+        x3 = int((frame_count * 2) % max(w - 180, 1))
+        y3 = int(h * 0.7)
+        
+        return [
+            (x1, y1, x1 + 120, y1 + 60, '2WHLR'),
+            (x2, y2, x2 + 160, y2 + 80, 'LMV'),
+            (x3, y3, x3 + 180, y3 + 90, 'HMV')
+        ]
+    
+    def detect_batch(self, frames):
+        return [self.detect(frame) for frame in frames]
+
+
+DETECTORS = {
+    'motion': MotionDetector,
+    'dummy': DummyDetector
+}
+
+
+def create_detector(mode):
+    if mode not in DETECTORS:
+        raise ValueError(f"Unknown detection mode: {mode}")
+    return DETECTORS[mode]()
+
+
+def scale_detections(detections, factor):
+    return [
+        (int(x1 * factor), int(y1 * factor), int(x2 * factor), int(y2 * factor), label)
+        for x1, y1, x2, y2, label in detections
+    ]
+
+
+def detection_delta(totals, drained):
+    change = np.maximum(totals - drained, 0)
+    return {
+        lane: {label: int(change[row, index]) for index, label in enumerate(VEHICLE_CLASSES)}
+        for row, lane in enumerate(('in', 'out'))
+    }
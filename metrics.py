@@ -0,0 +1,97 @@
+import bisect
+import math
+import threading
+
+
+FRAME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.02, 0.033, 0.05, 0.1, 0.25, 0.5, 1.0)
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1, 0.5)
+TICK_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    # No lock of its own: every instance has a single writer (a pipeline stage,
+    # the updater thread) or is observed under a lock the caller already holds.
+    def __init__(self, buckets=FRAME_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.reset()
+    
+    def reset(self):
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+    
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+    
+    def snapshot(self):
+        return self.buckets, list(self.counts), self.sum, self.count
+
+
+class LabeledCounter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+    
+    def inc(self, label, amount=1):
+        with self.lock:
+            self.values[label] = self.values.get(label, 0) + amount
+    
+    def snapshot(self):
+        with self.lock:
+            return dict(self.values)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{escape_label(value)}"' for key, value in labels.items()) + '}'
+
+
+def format_value(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
+
+
+class MetricsWriter:
+    def __init__(self):
+        self.lines = []
+    
+    def _header(self, name, help_text, metric_type):
+        self.lines.append(f'# HELP {name} {help_text}')
+        self.lines.append(f'# TYPE {name} {metric_type}')
+    
+    def counter(self, name, help_text, series):
+        self._header(name, help_text, 'counter')
+        for labels, value in series:
+            self.lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+    
+    def gauge(self, name, help_text, series):
+        self._header(name, help_text, 'gauge')
+        for labels, value in series:
+            self.lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+    
+    def histogram(self, name, help_text, series):
+        self._header(name, help_text, 'histogram')
+        for labels, (buckets, counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                bucket_labels = dict(labels, le=format_value(float(bound)))
+                self.lines.append(f'{name}_bucket{format_labels(bucket_labels)} {cumulative}')
+            self.lines.append(f'{name}_bucket{format_labels(dict(labels, le="+Inf"))} {count}')
+            self.lines.append(f'{name}_sum{format_labels(labels)} {format_value(float(total))}')
+            self.lines.append(f'{name}_count{format_labels(labels)} {count}')
+    
+    def render(self):
+        return '\n'.join(self.lines) + '\n'
@@ -0,0 +1,49 @@
+import contextlib
+import os
+
+import pytest
+
+import app
+
+
+@pytest.fixture(params=['json', 'sqlite'])
+def manager(request, tmp_path, monkeypatch):
+    # the managers keep their files relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        if request.param == 'sqlite':
+            manager = app.SQLiteAlarmManager(str(tmp_path / 'alarm_history.db'))
+        else:
+            manager = app.AlarmManager()
+        manager.delete_all_alarms()
+    return manager
+
+
+def page_cleared(manager, page_size, descending):
+    seen = []
+    cursor = None
+    while True:
+        if descending:
+            page = manager.query_alarms(status='cleared', before_id=cursor, limit=page_size, descending=True)
+        else:
+            page = manager.query_alarms(status='cleared', after_id=cursor, limit=page_size)
+        if not page:
+            return seen
+        seen.extend(app.alarm_number(alarm['id']) for alarm in page)
+        cursor = seen[-1]
+
+
+@pytest.mark.parametrize('descending', [False, True])
+def test_alarms_cleared_out_of_order_page_in_id_order(manager, descending):
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        ids = [manager.add_alarm('threshold_exceeded', 'in', vehicle_type='LMV', count=index, max_count=10)['id']
+               for index in range(60)]
+        # leave half active so queries walk the smaller 'cleared' bucket
+        cleared = ids[::2]
+        for offset in (2, 0, 1):
+            manager.clear_alarms(cleared[offset::3][::-1])
+    
+    expected = sorted(app.alarm_number(alarm_id) for alarm_id in cleared)
+    if descending:
+        expected.reverse()
+    assert page_cleared(manager, 7, descending) == expected
@@ -0,0 +1,65 @@
+import numpy as np
+
+
+THRESHOLD_LANES = ('out', 'in')
+VEHICLE_TYPES = ('2WHLR', 'LMV', 'HMV')
+
+
+def _number(value, name):
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        raise ValueError(f'{name} must be a number')
+    return float(value)
+
+
+class ThresholdTable:
+    # Compiled once per thresholds update and never mutated afterwards, so the
+    # updater can read a table while a new one is being swapped in.
+    def __init__(self, thresholds, limits, periods):
+        self.thresholds = thresholds
+        self.limits = limits
+        self.periods = periods
+        self.window_seconds = periods * 60
+        self.shape = limits.shape
+        self.keys = [(lane, vehicle_type) for lane in THRESHOLD_LANES for vehicle_type in VEHICLE_TYPES]
+    
+    def exceeded(self, counts):
+        return counts > self.limits
+    
+    def due(self, counts, last_violation, now, cooldown):
+        return self.exceeded(counts) & ((now - last_violation) > cooldown)
+    
+    def cells(self, mask):
+        for lane_index, type_index in zip(*np.nonzero(mask)):
+            yield THRESHOLD_LANES[lane_index], VEHICLE_TYPES[type_index], lane_index, type_index
+
+
+def compile_thresholds(thresholds):
+    if not isinstance(thresholds, dict):
+        raise ValueError('thresholds must be an object')
+    
+    shape = (len(THRESHOLD_LANES), len(VEHICLE_TYPES))
+    # a missing lane or vehicle type never fires, as before
+    limits = np.full(shape, np.inf)
+    periods = np.ones(shape)
+    
+    for lane_index, lane in enumerate(THRESHOLD_LANES):
+        lane_thresholds = thresholds.get(lane)
+        if not isinstance(lane_thresholds, dict) or 'time_period' not in lane_thresholds:
+            continue
+        
+        period = _number(lane_thresholds['time_period'], f'time_period for {lane} lane')
+        for type_index, vehicle_type in enumerate(VEHICLE_TYPES):
+            vehicle_thresholds = lane_thresholds.get(vehicle_type)
+            if not isinstance(vehicle_thresholds, dict) or 'max_count' not in vehicle_thresholds:
+                continue
+            
+            limits[lane_index, type_index] = _number(
+                vehicle_thresholds['max_count'], f'max_count for {vehicle_type} in {lane} lane'
+            )
+            periods[lane_index, type_index] = period
+    
+    return ThresholdTable(thresholds, limits, periods)
+
+
+def new_violation_times():
+    return np.full((len(THRESHOLD_LANES), len(VEHICLE_TYPES)), -np.inf)
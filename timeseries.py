@@ -0,0 +1,167 @@
+import os
+import threading
+
+import numpy as np
+
+from thresholds import VEHICLE_TYPES
+
+
+HISTORY_LANES = ('in', 'out')
+# (bucket seconds, buckets kept): 1 h of seconds, 1 day of minutes,
+# 1 week of quarter hours and 90 days of hours
+HISTORY_LEVELS = ((1, 3600), (60, 1440), (900, 672), (3600, 2160))
+DEFAULT_HISTORY_POINTS = 360
+MAX_HISTORY_POINTS = 5000
+# one point can't usefully span more than the longest retained range
+MAX_HISTORY_STEP = max(resolution * capacity for resolution, capacity in HISTORY_LEVELS)
+
+
+class TrafficHistory:
+    # Every level is a fixed ring of per-bucket vehicle counts. Slots remember
+    # which absolute bucket they hold, so stale slots read as empty and memory
+    # never grows with uptime.
+    def __init__(self, levels=HISTORY_LEVELS):
+        self.resolutions = [resolution for resolution, _ in levels]
+        self.capacities = [capacity for _, capacity in levels]
+        self.columns = len(HISTORY_LANES) * len(VEHICLE_TYPES)
+        self.lock = threading.Lock()
+        self.reset()
+    
+    def reset(self):
+        with self.lock:
+            self.data = [np.zeros((capacity, self.columns), dtype=np.int64) for capacity in self.capacities]
+            self.bucket_ids = [np.full(capacity, -1, dtype=np.int64) for capacity in self.capacities]
+            self.latest = None
+    
+    def record(self, now, in_increment, out_increment):
+        values = np.array(
+            [in_increment[vehicle_type] for vehicle_type in VEHICLE_TYPES] +
+            [out_increment[vehicle_type] for vehicle_type in VEHICLE_TYPES],
+            dtype=np.int64
+        )
+        
+        with self.lock:
+            for resolution, capacity, data, bucket_ids in zip(self.resolutions, self.capacities,
+                                                              self.data, self.bucket_ids):
+                bucket = int(now // resolution)
+                slot = bucket % capacity
+                if bucket_ids[slot] != bucket:
+                    data[slot] = 0
+                    bucket_ids[slot] = bucket
+                data[slot] += values
+            self.latest = now
+    
+    def _covers(self, level, start):
+        if self.latest is None:
+            return True
+        resolution = self.resolutions[level]
+        oldest = (int(self.latest // resolution) - self.capacities[level] + 1) * resolution
+        return start >= oldest
+    
+    def _choose_level(self, start, step):
+        # the coarsest level that still resolves the step and reaches back to
+        # start; failing that, the finest level that reaches back at all
+        covering = [level for level in range(len(self.resolutions)) if self._covers(level, start)]
+        fine_enough = [level for level in covering if self.resolutions[level] <= step]
+        if fine_enough:
+            return fine_enough[-1]
+        if covering:
+            return covering[0]
+        return len(self.resolutions) - 1
+    
+    def query(self, start, end, step):
+        if step > MAX_HISTORY_STEP:
+            raise ValueError(f'step must be at most {MAX_HISTORY_STEP} seconds')
+        
+        level = self._choose_level(start, step)
+        resolution = self.resolutions[level]
+        capacity = self.capacities[level]
+        
+        # steps snap to whole buckets of the chosen level
+        per_point = max(1, int(-(-step // resolution)))
+        step = per_point * resolution
+        first = int(start // step) * step
+        points = max(1, int(-(-(end - first) // step)))
+        if points > MAX_HISTORY_POINTS:
+            raise ValueError(f'Range needs {points} points; at most {MAX_HISTORY_POINTS} are allowed, use a larger step')
+        
+        # only the buckets still in the ring can hold counts, so read just those
+        # and leave the rest of the range as zeros
+        first_bucket = int(first // resolution)
+        series = np.zeros((points, self.columns), dtype=np.int64)
+        with self.lock:
+            if self.latest is not None:
+                newest = int(self.latest // resolution)
+                low = max(first_bucket, newest - capacity + 1)
+                high = min(first_bucket + points * per_point, newest + 1)
+                if low < high:
+                    ids = np.arange(low, high, dtype=np.int64)
+                    slots = ids % capacity
+                    valid = self.bucket_ids[level][slots] == ids
+                    np.add.at(series, (ids[valid] - first_bucket) // per_point, self.data[level][slots[valid]])
+        
+        timestamps = (first + np.arange(points) * step).tolist()
+        
+        lanes = {}
+        for lane_index, lane in enumerate(HISTORY_LANES):
+            offset = lane_index * len(VEHICLE_TYPES)
+            lanes[lane] = {
+                vehicle_type: series[:, offset + type_index].tolist()
+                for type_index, vehicle_type in enumerate(VEHICLE_TYPES)
+            }
+        
+        # total follows the dashboard's formula: incoming - outgoing
+        size = len(VEHICLE_TYPES)
+        total = series[:, :size] - series[:, size:]
+        lanes['total'] = {vehicle_type: total[:, index].tolist() for index, vehicle_type in enumerate(VEHICLE_TYPES)}
+        
+        return {
+            'from': first,
+            'to': first + points * step,
+            'step': step,
+            'resolution': resolution,
+            'timestamps': timestamps,
+            'series': lanes
+        }
+    
+    def flush(self, path):
+        with self.lock:
+            arrays = {'resolutions': np.array(self.resolutions), 'capacities': np.array(self.capacities),
+                      'latest': np.array(-1.0 if self.latest is None else self.latest)}
+            for index in range(len(self.resolutions)):
+                arrays[f'data_{index}'] = self.data[index].copy()
+                arrays[f'ids_{index}'] = self.bucket_ids[index].copy()
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    
+    def load(self, path):
+        try:
+            with np.load(path) as saved:
+                if saved['resolutions'].tolist() != self.resolutions or \
+                   saved['capacities'].tolist() != self.capacities:
+                    print(f'Ignoring {path}: saved with different history levels')
+                    return False
+                
+                with self.lock:
+                    for index in range(len(self.resolutions)):
+                        self.data[index] = saved[f'data_{index}'].astype(np.int64)
+                        self.bucket_ids[index] = saved[f'ids_{index}'].astype(np.int64)
+                    latest = float(saved['latest'])
+                    self.latest = None if latest < 0 else latest
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            print(f'Failed to load traffic history from {path}: {e}')
+            return False
+        
+        print(f'Traffic history loaded from {path}')
+        return True
@@ -0,0 +1,267 @@
+import numpy as np
+
+# thresholds rather than detection, so the counting-line defaults and checks load
+# without OpenCV
+from thresholds import VEHICLE_TYPES as VEHICLE_CLASSES
+
+
+CLASS_INDEX = {label: index for index, label in enumerate(VEHICLE_CLASSES)}
+
+
+LANES = ('in', 'out')
+DIRECTIONS = ('forward', 'backward')
+MAX_COUNTING_LINES = 8
+
+# Lines are in normalized frame coordinates (0..1), so they survive resolution
+# and scale changes. "forward" means crossing from the left of p1->p2 to its
+# right; for a left-to-right horizontal line that is moving down the frame.
+DEFAULT_COUNTING_LINES = [
+    {'name': 'in', 'lane': 'in', 'direction': 'forward', 'x1': 0.0, 'y1': 0.5, 'x2': 1.0, 'y2': 0.5},
+    {'name': 'out', 'lane': 'out', 'direction': 'backward', 'x1': 0.0, 'y1': 0.5, 'x2': 1.0, 'y2': 0.5}
+]
+
+
+def validate_counting_lines(lines):
+    if not isinstance(lines, list) or not lines:
+        raise ValueError('lines must be a non-empty list')
+    if len(lines) > MAX_COUNTING_LINES:
+        raise ValueError(f'At most {MAX_COUNTING_LINES} counting lines are supported')
+    
+    validated = []
+    for index, line in enumerate(lines):
+        if not isinstance(line, dict):
+            raise ValueError(f'Line {index} must be an object')
+        
+        lane = line.get('lane')
+        if lane not in LANES:
+            raise ValueError(f'Line {index}: lane must be one of {", ".join(LANES)}')
+        
+        direction = line.get('direction', 'forward')
+        if direction not in DIRECTIONS:
+            raise ValueError(f'Line {index}: direction must be one of {", ".join(DIRECTIONS)}')
+        
+        points = {}
+        for key in ('x1', 'y1', 'x2', 'y2'):
+            value = line.get(key)
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or not 0.0 <= value <= 1.0:
+                raise ValueError(f'Line {index}: {key} must be a number between 0 and 1')
+            points[key] = float(value)
+        
+        if points['x1'] == points['x2'] and points['y1'] == points['y2']:
+            raise ValueError(f'Line {index}: endpoints must differ')
+        
+        validated.append({
+            'name': str(line.get('name', f'line{index}')),
+            'lane': lane,
+            'direction': direction,
+            **points
+        })
+    
+    return validated
+
+
+def box_iou(a, b):
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    
+    return intersection / np.maximum(union, 1e-12)
+
+
+def match_greedy(cost, max_cost):
+    cost = np.where(cost < max_cost, cost, np.inf)
+    rows = np.arange(cost.shape[0])
+    matched_rows = []
+    matched_cols = []
+    
+    # accept every mutual best pair per round; the global minimum is always
+    # mutual, so each round makes progress and the result equals greedy-by-cost
+    while cost.size and np.isfinite(cost).any():
+        best_col = cost.argmin(axis=1)
+        best_row = cost.argmin(axis=0)
+        mutual = (best_row[best_col] == rows) & np.isfinite(cost[rows, best_col])
+        
+        row_index = rows[mutual]
+        col_index = best_col[mutual]
+        matched_rows.append(row_index)
+        matched_cols.append(col_index)
+        
+        cost[row_index, :] = np.inf
+        cost[:, col_index] = np.inf
+    
+    if not matched_rows:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(matched_rows), np.concatenate(matched_cols)
+
+
+def line_crossings(starts, ends, lines):
+    p1 = lines[:, 0:2]
+    p2 = lines[:, 2:4]
+    line_vector = p2 - p1
+    motion = ends - starts
+    
+    def side_of_lines(points):
+        return (line_vector[None, :, 0] * (points[:, None, 1] - p1[None, :, 1])
+                - line_vector[None, :, 1] * (points[:, None, 0] - p1[None, :, 0]))
+    
+    def side_of_motion(points):
+        return (motion[:, None, 0] * (points[None, :, 1] - starts[:, None, 1])
+                - motion[:, None, 1] * (points[None, :, 0] - starts[:, None, 0]))
+    
+    before = side_of_lines(starts)
+    after = side_of_lines(ends)
+    within_segment = side_of_motion(p1) * side_of_motion(p2) <= 0
+    
+    forward = (before < 0) & (after >= 0) & within_segment
+    backward = (before > 0) & (after <= 0) & within_segment
+    return forward, backward
+
+
+class LineCrossingTracker:
+    def __init__(self, lines=None, max_misses=10, min_hits=2, max_cost=2.0, distance_gate=1.5):
+        self.max_misses = max_misses
+        self.min_hits = min_hits
+        self.max_cost = max_cost
+        self.distance_gate = distance_gate
+        self.set_lines(lines if lines is not None else DEFAULT_COUNTING_LINES)
+        self.reset()
+    
+    def reset(self):
+        self.next_id = 1
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.boxes = np.zeros((0, 4))
+        self.velocity = np.zeros((0, 4))
+        self.hits = np.zeros(0, dtype=np.int64)
+        self.misses = np.zeros(0, dtype=np.int64)
+        self.class_votes = np.zeros((0, len(VEHICLE_CLASSES)), dtype=np.int64)
+        self.counted = np.zeros((0, len(self.lines)), dtype=bool)
+        self.totals = np.zeros((len(LANES), len(VEHICLE_CLASSES)), dtype=np.int64)
+    
+    def set_lines(self, lines):
+        self.lines = [dict(line) for line in lines]
+        self.line_points = np.array(
+            [[line['x1'], line['y1'], line['x2'], line['y2']] for line in self.lines],
+            dtype=np.float64
+        ).reshape(-1, 4)
+        self.line_lanes = np.array([LANES.index(line['lane']) for line in self.lines], dtype=np.int64)
+        self.line_forward = np.array([line['direction'] == 'forward' for line in self.lines], dtype=bool)
+        
+        if hasattr(self, 'ids'):
+            self.counted = np.zeros((len(self.ids), len(self.lines)), dtype=bool)
+    
+    def _cost_matrix(self, predicted, boxes):
+        cost = 1.0 - box_iou(predicted, boxes)
+        
+        # boxes that no longer overlap (fast movers, skipped frames) fall back to
+        # centroid distance gated by the track's own size
+        track_centers = (predicted[:, 0:2] + predicted[:, 2:4]) / 2
+        centers = (boxes[:, 0:2] + boxes[:, 2:4]) / 2
+        distance = np.linalg.norm(track_centers[:, None, :] - centers[None, :, :], axis=2)
+        track_size = np.sqrt(np.maximum(
+            (predicted[:, 2] - predicted[:, 0]) * (predicted[:, 3] - predicted[:, 1]), 1e-12
+        ))
+        gate = np.broadcast_to(self.distance_gate * track_size[:, None], cost.shape)
+        fallback = np.where(distance < gate, 1.0 + distance / gate, np.inf)
+        
+        return np.where(cost >= 1.0, fallback, cost)
+    
+    def update(self, detections, frame_shape):
+        height, width = frame_shape[:2]
+        scale = np.array([width, height, width, height], dtype=np.float64)
+        
+        if detections:
+            boxes = np.array([detection[:4] for detection in detections], dtype=np.float64) / scale
+            classes = np.array([CLASS_INDEX[detection[4]] for detection in detections], dtype=np.int64)
+        else:
+            boxes = np.zeros((0, 4))
+            classes = np.zeros(0, dtype=np.int64)
+        
+        predicted = self.boxes + self.velocity
+        
+        if len(predicted) and len(boxes):
+            track_index, detection_index = match_greedy(self._cost_matrix(predicted, boxes), self.max_cost)
+        else:
+            track_index = detection_index = np.zeros(0, dtype=np.int64)
+        
+        previous_centers = (self.boxes[track_index, 0:2] + self.boxes[track_index, 2:4]) / 2
+        matched_boxes = boxes[detection_index]
+        
+        unmatched_tracks = np.ones(len(self.ids), dtype=bool)
+        unmatched_tracks[track_index] = False
+        self.boxes[unmatched_tracks] = predicted[unmatched_tracks]
+        self.misses[unmatched_tracks] += 1
+        
+        self.velocity[track_index] = 0.5 * self.velocity[track_index] + 0.5 * (matched_boxes - self.boxes[track_index])
+        self.boxes[track_index] = matched_boxes
+        self.hits[track_index] += 1
+        self.misses[track_index] = 0
+        np.add.at(self.class_votes, (track_index, classes[detection_index]), 1)
+        
+        if len(track_index) and len(self.lines):
+            self._count_crossings(track_index, previous_centers, (matched_boxes[:, 0:2] + matched_boxes[:, 2:4]) / 2)
+        
+        unmatched_detections = np.ones(len(boxes), dtype=bool)
+        unmatched_detections[detection_index] = False
+        self._add_tracks(boxes[unmatched_detections], classes[unmatched_detections])
+        
+        keep = self.misses <= self.max_misses
+        if not keep.all():
+            self._select(keep)
+        
+        visible = (self.misses == 0) & (self.hits >= self.min_hits)
+        labels = self.class_votes[visible].argmax(axis=1)
+        pixel_boxes = (self.boxes[visible] * scale).astype(np.int64)
+        return [
+            (int(box[0]), int(box[1]), int(box[2]), int(box[3]), VEHICLE_CLASSES[label], int(track_id))
+            for box, label, track_id in zip(pixel_boxes, labels, self.ids[visible])
+        ]
+    
+    def _count_crossings(self, track_index, starts, ends):
+        confirmed = self.hits[track_index] >= self.min_hits
+        track_index, starts, ends = track_index[confirmed], starts[confirmed], ends[confirmed]
+        if not len(track_index):
+            return
+        
+        forward, backward = line_crossings(starts, ends, self.line_points)
+        crossed = np.where(self.line_forward[None, :], forward, backward)
+        crossed &= ~self.counted[track_index]
+        
+        rows, line_index = np.nonzero(crossed)
+        if not len(rows):
+            return
+        
+        self.counted[track_index[rows], line_index] = True
+        labels = self.class_votes[track_index[rows]].argmax(axis=1)
+        np.add.at(self.totals, (self.line_lanes[line_index], labels), 1)
+    
+    def _add_tracks(self, boxes, classes):
+        count = len(boxes)
+        if not count:
+            return
+        
+        votes = np.zeros((count, len(VEHICLE_CLASSES)), dtype=np.int64)
+        votes[np.arange(count), classes] = 1
+        
+        self.ids = np.concatenate([self.ids, np.arange(self.next_id, self.next_id + count)])
+        self.next_id += count
+        self.boxes = np.concatenate([self.boxes, boxes])
+        self.velocity = np.concatenate([self.velocity, np.zeros((count, 4))])
+        self.hits = np.concatenate([self.hits, np.ones(count, dtype=np.int64)])
+        self.misses = np.concatenate([self.misses, np.zeros(count, dtype=np.int64)])
+        self.class_votes = np.concatenate([self.class_votes, votes])
+        self.counted = np.concatenate([self.counted, np.zeros((count, len(self.lines)), dtype=bool)])
+    
+    def _select(self, keep):
+        self.ids = self.ids[keep]
+        self.boxes = self.boxes[keep]
+        self.velocity = self.velocity[keep]
+        self.hits = self.hits[keep]
+        self.misses = self.misses[keep]
+        self.class_votes = self.class_votes[keep]
+        self.counted = self.counted[keep]
@@ -0,0 +1,849 @@
+import threading
+import time
+import queue
+import contextlib
+import multiprocessing
+from multiprocessing import shared_memory
+import cv2
+import numpy as np
+
+from detection import VEHICLE_CLASSES, CLASS_COLORS, DETECTORS, create_detector, detection_delta, scale_detections
+from metrics import FRAME_BUCKETS, Histogram
+from tracking import LANES, DIRECTIONS, MAX_COUNTING_LINES, DEFAULT_COUNTING_LINES, LineCrossingTracker
+
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.histogram = Histogram(FRAME_BUCKETS)
+        self.reset()
+    
+    def reset(self):
+        self.histogram.reset()
+        self.frames = 0
+        self.dropped = 0
+        self.total_seconds = 0.0
+        self.last_ms = 0.0
+        self.avg_ms = 0.0
+        self.max_ms = 0.0
+    
+    def record(self, seconds):
+        ms = seconds * 1000
+        self.frames += 1
+        self.total_seconds += seconds
+        self.last_ms = ms
+        self.avg_ms = ms if self.frames == 1 else self.avg_ms * 0.9 + ms * 0.1
+        self.max_ms = max(self.max_ms, ms)
+        self.histogram.observe(seconds)
+    
+    def snapshot(self):
+        return {
+            'frames': self.frames,
+            'dropped': self.dropped,
+            'last_ms': round(self.last_ms, 2),
+            'avg_ms': round(self.avg_ms, 2),
+            'max_ms': round(self.max_ms, 2)
+        }
+
+
+def put_drop_oldest(frame_queue, item):
+    dropped = 0
+    while True:
+        try:
+            frame_queue.put_nowait(item)
+            return dropped
+        except queue.Full:
+            try:
+                frame_queue.get_nowait()
+                dropped += 1
+            except queue.Empty:
+                pass
+
+
+class AdaptiveFrameController:
+    def __init__(self, initial_skip=2, min_skip=1, max_skip=8, scales=(1.0, 0.75, 0.5),
+                 budget_ms=None, utilization=0.8, adjust_every=15, enabled=True):
+        self.initial_skip = initial_skip
+        self.min_skip = min_skip
+        self.max_skip = max_skip
+        self.scales = scales
+        self.budget_ms = budget_ms
+        self.utilization = utilization
+        self.adjust_every = adjust_every
+        self.enabled = enabled
+        self.reset()
+    
+    def reset(self, initial_skip=None):
+        if initial_skip is not None:
+            self.initial_skip = initial_skip
+        self.skip = self.initial_skip
+        self.scale_index = 0
+        self.cost_ms = 0.0
+        self.samples = 0
+        self.adjustments = 0
+    
+    @property
+    def scale(self):
+        return self.scales[self.scale_index]
+    
+    def get_budget_ms(self, fps):
+        if self.budget_ms is not None:
+            return self.budget_ms
+        return 1000.0 / fps * self.utilization
+    
+    def should_process(self, frame_count):
+        return frame_count % self.skip == 0
+    
+    def record(self, cost_ms, fps):
+        self.cost_ms = cost_ms if self.cost_ms == 0.0 else self.cost_ms * 0.8 + cost_ms * 0.2
+        self.samples += 1
+        
+        if not self.enabled or self.samples < self.adjust_every:
+            return
+        self.samples = 0
+        
+        budget = self.get_budget_ms(fps)
+        per_frame_cost = self.cost_ms / self.skip
+        
+        if per_frame_cost > budget:
+            if self.skip < self.max_skip:
+                self.skip += 1
+            elif self.scale_index < len(self.scales) - 1:
+                self.scale_index += 1
+            else:
+                return
+        elif self.scale_index > 0:
+            ratio = self.scales[self.scale_index - 1] / self.scale
+            if self.cost_ms * ratio * ratio / self.skip < budget * 0.7:
+                self.scale_index -= 1
+            else:
+                return
+        elif self.skip > self.min_skip and self.cost_ms / (self.skip - 1) < budget * 0.7:
+            self.skip -= 1
+        else:
+            return
+        
+        self.adjustments += 1
+    
+    def snapshot(self, fps):
+        return {
+            'enabled': self.enabled,
+            'skip': self.skip,
+            'scale': self.scale,
+            'effective_fps': round(fps / self.skip, 2),
+            'cost_ms': round(self.cost_ms, 2),
+            'budget_ms': round(self.get_budget_ms(fps), 2),
+            'adjustments': self.adjustments
+        }
+
+
+class OverlayRenderer:
+    FONT = cv2.FONT_HERSHEY_SIMPLEX
+    MAX_SPRITES = 256
+    
+    def __init__(self, background_alpha=0.45, padding=3):
+        self.background_alpha = background_alpha
+        self.padding = padding
+        self.sprites = {}
+    
+    def _sprite(self, text, color, font_scale, thickness, background):
+        key = (text, color, font_scale, thickness, background)
+        sprite = self.sprites.get(key)
+        if sprite is not None:
+            return sprite
+        
+        if len(self.sprites) >= self.MAX_SPRITES:
+            self.sprites.clear()
+        
+        (text_width, text_height), baseline = cv2.getTextSize(text, self.FONT, font_scale, thickness)
+        pad = self.padding if background else 0
+        ascent = text_height + pad
+        height = text_height + baseline + thickness + 2 * pad
+        width = text_width + thickness + 2 * pad
+        
+        # anti-aliased coverage is rendered once; blending reuses it every frame
+        mask = np.zeros((height, width), np.uint8)
+        cv2.putText(mask, text, (pad, ascent), self.FONT, font_scale, 255, thickness, cv2.LINE_AA)
+        coverage = mask.astype(np.float32)[..., None] / 255.0
+        
+        background_alpha = self.background_alpha if background else 0.0
+        alpha = background_alpha + (1.0 - background_alpha) * coverage
+        premultiplied = coverage * np.array(color, np.float32)
+        
+        sprite = (1.0 - alpha, premultiplied, pad, ascent, text_width)
+        self.sprites[key] = sprite
+        return sprite
+    
+    def _blit(self, frame, sprite, x, y):
+        inverse_alpha, premultiplied = sprite[0], sprite[1]
+        height, width = premultiplied.shape[:2]
+        frame_height, frame_width = frame.shape[:2]
+        
+        left, top = max(x, 0), max(y, 0)
+        right, bottom = min(x + width, frame_width), min(y + height, frame_height)
+        if left >= right or top >= bottom:
+            return
+        
+        sx, sy = left - x, top - y
+        sw, sh = right - left, bottom - top
+        roi = frame[top:bottom, left:right]
+        blended = roi * inverse_alpha[sy:sy + sh, sx:sx + sw] + premultiplied[sy:sy + sh, sx:sx + sw]
+        np.copyto(roi, blended, casting='unsafe')
+    
+    def draw_text(self, frame, text, origin, color, font_scale=0.6, thickness=2, background=True):
+        sprite = self._sprite(text, color, font_scale, thickness, background)
+        pad, ascent = sprite[2], sprite[3]
+        self._blit(frame, sprite, origin[0] - pad, origin[1] - ascent)
+    
+    def draw_counter(self, frame, prefix, value, origin, color, font_scale=0.8, thickness=2):
+        # compose from per-character sprites so a changing number never grows the cache
+        x, y = origin
+        for part in [prefix] + list(str(value)):
+            sprite = self._sprite(part, color, font_scale, thickness, False)
+            self._blit(frame, sprite, x, y - sprite[3])
+            x += sprite[4]
+
+
+class VideoProcessor:
+    def __init__(self, decoder_slots=None):
+        self.decoder_slots = decoder_slots if decoder_slots is not None else contextlib.nullcontext()
+        
+        self.is_processing = False
+        self.pipeline_threads = []
+        self.video_path = None
+        
+        self.current_frame = None
+        self.frame_seq = 0
+        self.frame_lock = threading.Lock()
+        
+        self.PROCESS_EVERY_N_FRAMES = 2
+        self.FPS = 30
+        self.QUEUE_SIZE = 4
+        self.frame_controller = AdaptiveFrameController(initial_skip=self.PROCESS_EVERY_N_FRAMES)
+        self.DECODE_AHEAD_FRAMES = 2
+        
+        self.decode_queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+        self.publish_queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+        self.stage_stats = {name: StageStats(name) for name in ('decode', 'annotate', 'publish')}
+        self.overlay = OverlayRenderer()
+        
+        self.DETECTION_MODE = 'motion'
+        self.DETECTION_BATCH_SIZE = 4
+        self.detector = None
+        self.last_detections = []
+        self.tracker = LineCrossingTracker()
+        self.counting_lines = [dict(line) for line in DEFAULT_COUNTING_LINES]
+        self.lines_version = 0
+        self.applied_lines_version = 0
+        self.detection_totals = np.zeros((2, len(VEHICLE_CLASSES)), dtype=np.int64)
+        self.drained_totals = self.detection_totals.copy()
+        
+        print("Simple VideoProcessor initialized")
+    
+    def start_processing(self, video_path):
+        if self.is_processing:
+            print("Processing already running")
+            return False
+        
+        if not video_path or not isinstance(video_path, str):
+            print("Invalid video path")
+            return False
+        
+        self.video_path = video_path
+        self.is_processing = True
+        
+        self.decode_queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+        self.publish_queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+        for stats in self.stage_stats.values():
+            stats.reset()
+        self.frame_controller.reset(self.PROCESS_EVERY_N_FRAMES)
+        
+        self.detector = create_detector(self.DETECTION_MODE)
+        self.last_detections = []
+        self.tracker.reset()
+        with self.frame_lock:
+            self.detection_totals[:] = 0
+            self.drained_totals[:] = 0
+        
+        self.pipeline_threads = [
+            threading.Thread(target=self._decode_stage, daemon=True),
+            threading.Thread(target=self._annotate_stage, daemon=True),
+            threading.Thread(target=self._publish_stage, daemon=True)
+        ]
+        for thread in self.pipeline_threads:
+            thread.start()
+        
+        print("Simple video processing started")
+        return True
+    
+    def stop_processing(self):
+        if not self.is_processing:
+            return
+        
+        print("Stopping simple video processing...")
+        self.is_processing = False
+        
+        for thread in self.pipeline_threads:
+            if thread.is_alive():
+                thread.join(timeout=2)
+        self.pipeline_threads = []
+        
+        with self.frame_lock:
+            self.current_frame = None
+            self.frame_seq += 1
+        
+        print("Simple video processing stopped")
+    
+    def get_latest_frame(self):
+        with self.frame_lock:
+            return self.frame_seq, self.current_frame
+    
+    def is_frame_intact(self, seq):
+        return True
+    
+    def _publish_frame(self, frame):
+        with self.frame_lock:
+            if not self.is_processing:
+                return False
+            self.current_frame = frame
+            self.frame_seq += 1
+        return True
+    
+    def get_pipeline_stats(self):
+        stats = {name: stage.snapshot() for name, stage in self.stage_stats.items()}
+        stats['fps'] = round(self.FPS, 2)
+        stats['decode_queue'] = self.decode_queue.qsize()
+        stats['publish_queue'] = self.publish_queue.qsize()
+        stats['adaptive'] = self.frame_controller.snapshot(self.FPS)
+        return stats
+    
+    def get_stage_histograms(self):
+        return {name: stage.histogram.snapshot() for name, stage in self.stage_stats.items()}
+    
+    def _decode_stage(self):
+        print(f"Opening video: {self.video_path}")
+        cap = cv2.VideoCapture(self.video_path)
+        
+        if not cap.isOpened():
+            print(f"Failed to open video: {self.video_path}")
+            self.is_processing = False
+            return
+        
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        if fps and fps > 0:
+            self.FPS = fps
+        else:
+            self.FPS = 30
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        
+        print(f"Video info: {total_frames} frames @ {self.FPS:.2f} FPS")
+        
+        stats = self.stage_stats['decode']
+        frame_interval = 1.0 / self.FPS
+        start_time = time.time()
+        presentation_index = 0
+        frame_count = 0
+        
+        decode_ahead = self.DECODE_AHEAD_FRAMES * frame_interval
+        
+        while cap.isOpened() and self.is_processing:
+            due_time = start_time + presentation_index * frame_interval
+            now = time.time()
+            
+            if due_time - now > decode_ahead:
+                time.sleep(due_time - now - decode_ahead)
+                continue
+            
+            with self.decoder_slots:
+                stage_start = time.time()
+                if now - due_time > frame_interval:
+                    ret = cap.grab()
+                    frame = None
+                else:
+                    ret, frame = cap.read()
+            
+            if not ret:
+                if frame_count == 0:
+                    print("Video has no readable frames")
+                    self.is_processing = False
+                    break
+                print("Video ended, looping...")
+                cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                frame_count = 0
+                continue
+            
+            frame_count += 1
+            presentation_index += 1
+            
+            if frame is None:
+                stats.dropped += 1
+                continue
+            
+            stats.record(time.time() - stage_start)
+            stats.dropped += put_drop_oldest(self.decode_queue, (frame_count, due_time, frame))
+        
+        cap.release()
+        print("Decode stage ended")
+    
+    def _annotate_stage(self):
+        stats = self.stage_stats['annotate']
+        
+        while self.is_processing:
+            try:
+                batch = [self.decode_queue.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            
+            # take whatever is already decoded so detection runs as one batch
+            while len(batch) < self.DETECTION_BATCH_SIZE:
+                try:
+                    batch.append(self.decode_queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            batch_start = time.time()
+            controller = self.frame_controller
+            self._apply_counting_lines()
+            
+            selected = [index for index, item in enumerate(batch) if controller.should_process(item[0])]
+            results = {}
+            if selected:
+                # only the detector input is downscaled under load; boxes are mapped
+                # back so tracking and the published frame stay at full resolution
+                scale = controller.scale
+                inputs = [batch[index][2] for index in selected]
+                if scale < 1.0:
+                    inputs = [cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+                              for frame in inputs]
+                try:
+                    detections = self.detector.detect_batch(inputs)
+                    if scale < 1.0:
+                        detections = [scale_detections(frame_detections, 1.0 / scale)
+                                      for frame_detections in detections]
+                    results = dict(zip(selected, detections))
+                except Exception as e:
+                    print(f"Detection error: {e}")
+            
+            for index, (frame_count, due_time, frame) in enumerate(batch):
+                if index in results:
+                    self.last_detections = self._track_detections(results[index], frame.shape)
+                
+                try:
+                    self._draw_detections(frame, self.last_detections, frame_count)
+                except Exception as e:
+                    print(f"Frame {frame_count} error: {e}")
+                
+                stats.dropped += put_drop_oldest(self.publish_queue, (frame_count, due_time, frame))
+            
+            elapsed = time.time() - batch_start
+            for _ in batch:
+                stats.record(elapsed / len(batch))
+            if selected:
+                controller.record(elapsed * 1000 / len(selected), self.FPS)
+        
+        print("Annotate stage ended")
+    
+    def _track_detections(self, detections, frame_shape):
+        if not self.detector.FEEDS_COUNTERS:
+            return detections
+        
+        tracked = self.tracker.update(detections, frame_shape)
+        with self.frame_lock:
+            self.detection_totals[:] = self.tracker.totals
+        return tracked
+    
+    def set_counting_lines(self, lines):
+        with self.frame_lock:
+            self.counting_lines = [dict(line) for line in lines]
+            self.lines_version += 1
+    
+    def _apply_counting_lines(self):
+        if self.lines_version == self.applied_lines_version:
+            return
+        
+        with self.frame_lock:
+            lines = self.counting_lines
+            self.applied_lines_version = self.lines_version
+        self.tracker.set_lines(lines)
+    
+    def drain_detection_counts(self):
+        if self.detector is None or not self.detector.FEEDS_COUNTERS:
+            return None
+        
+        with self.frame_lock:
+            totals = self.detection_totals.copy()
+        counts = detection_delta(totals, self.drained_totals)
+        self.drained_totals = totals
+        return counts
+    
+    def _publish_stage(self):
+        stats = self.stage_stats['publish']
+        
+        while self.is_processing:
+            try:
+                frame_count, due_time, frame = self.publish_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            
+            delay = due_time - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            elif -delay > 1.0 / self.FPS and not self.publish_queue.empty():
+                stats.dropped += 1
+                continue
+            
+            stage_start = time.time()
+            if not self._publish_frame(frame):
+                break
+            stats.record(time.time() - stage_start)
+        
+        print("Publish stage ended")
+    
+    def _draw_detections(self, frame, detections, frame_count):
+        # the annotate stage owns the decoded frame, so draw on it in place
+        height, width = frame.shape[:2]
+        for line in self.tracker.lines:
+            color = (0, 255, 255) if line['lane'] == 'in' else (255, 0, 255)
+            start = (int(line['x1'] * width), int(line['y1'] * height))
+            end = (int(line['x2'] * width), int(line['y2'] * height))
+            cv2.line(frame, start, end, color, 1)
+        
+        for detection in detections:
+            x1, y1, x2, y2, label = detection[:5]
+            color = CLASS_COLORS[label]
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+            self.overlay.draw_text(frame, label, (x1 + 5, y1 - 10), color)
+        
+        self.overlay.draw_counter(frame, "Frame: ", frame_count, (10, 30), (255, 255, 255))
+        
+        return frame
+
+
+class SharedFrameRing:
+    HEADER_SIZE = 6
+    SLOT_META_SIZE = 4
+    STAGES = ('decode', 'annotate', 'publish')
+    STAT_FIELDS = ('frames', 'dropped', 'last_ms', 'avg_ms', 'max_ms')
+    LINE_FIELDS = 6
+    
+    def __init__(self, name=None, slots=4, slot_bytes=0):
+        if name is None:
+            size = self._layout_size(slots, slot_bytes)
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self._map(slots, slot_bytes)
+            self.header[:] = [0, slots, slot_bytes, 0, 0, 0]
+            self.slot_meta[:] = 0
+            self.stats[:] = 0
+            self.counts[:] = 0
+            self.histograms[:] = 0
+            self.lines_state[:] = 0
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            header = np.ndarray((self.HEADER_SIZE,), dtype=np.int64, buffer=self.shm.buf)
+            slots, slot_bytes = int(header[1]), int(header[2])
+            del header
+            self._map(slots, slot_bytes)
+        
+        self.name = self.shm.name
+    
+    def _layout_size(self, slots, slot_bytes):
+        return (self.HEADER_SIZE * 8
+                + slots * self.SLOT_META_SIZE * 8
+                + len(self.STAGES) * len(self.STAT_FIELDS) * 8
+                + 2 * len(VEHICLE_CLASSES) * 8
+                + len(self.STAGES) * (len(FRAME_BUCKETS) + 3) * 8
+                + 2 * 8 + MAX_COUNTING_LINES * self.LINE_FIELDS * 8
+                + slots * slot_bytes)
+    
+    def _map(self, slots, slot_bytes):
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        
+        offset = 0
+        self.header = np.ndarray((self.HEADER_SIZE,), dtype=np.int64, buffer=self.shm.buf, offset=offset)
+        offset += self.HEADER_SIZE * 8
+        self.slot_meta = np.ndarray((slots, self.SLOT_META_SIZE), dtype=np.int64, buffer=self.shm.buf, offset=offset)
+        offset += slots * self.SLOT_META_SIZE * 8
+        self.stats = np.ndarray((len(self.STAGES), len(self.STAT_FIELDS)), dtype=np.float64, buffer=self.shm.buf, offset=offset)
+        offset += len(self.STAGES) * len(self.STAT_FIELDS) * 8
+        self.counts = np.ndarray((2, len(VEHICLE_CLASSES)), dtype=np.int64, buffer=self.shm.buf, offset=offset)
+        offset += 2 * len(VEHICLE_CLASSES) * 8
+        # per stage: bucket counts, +Inf bucket, sum, count
+        self.histograms = np.ndarray((len(self.STAGES), len(FRAME_BUCKETS) + 3), dtype=np.float64,
+                                     buffer=self.shm.buf, offset=offset)
+        offset += len(self.STAGES) * (len(FRAME_BUCKETS) + 3) * 8
+        self.lines_state = np.ndarray((2,), dtype=np.int64, buffer=self.shm.buf, offset=offset)
+        offset += 2 * 8
+        self.lines = np.ndarray((MAX_COUNTING_LINES, self.LINE_FIELDS), dtype=np.float64, buffer=self.shm.buf, offset=offset)
+        offset += MAX_COUNTING_LINES * self.LINE_FIELDS * 8
+        self.data = np.ndarray((slots, slot_bytes), dtype=np.uint8, buffer=self.shm.buf, offset=offset)
+    
+    def write(self, frame):
+        if frame.nbytes > self.slot_bytes:
+            return False
+        
+        seq = int(self.header[0]) + 1
+        slot = seq % self.slots
+        
+        self.slot_meta[slot, 0] = -1
+        self.data[slot, :frame.nbytes].reshape(frame.shape)[...] = frame
+        height, width = frame.shape[:2]
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+        self.slot_meta[slot, 1:] = (height, width, channels)
+        self.slot_meta[slot, 0] = seq
+        self.header[0] = seq
+        return True
+    
+    def read_latest(self):
+        seq = int(self.header[0])
+        if seq <= 0:
+            return seq, None
+        
+        slot = seq % self.slots
+        if self.slot_meta[slot, 0] != seq:
+            return seq, None
+        
+        height, width, channels = (int(value) for value in self.slot_meta[slot, 1:])
+        frame = self.data[slot, :height * width * channels].reshape(height, width, channels)
+        frame.flags.writeable = False
+        return seq, frame
+    
+    def is_intact(self, seq):
+        return self.slot_meta[seq % self.slots, 0] == seq
+    
+    def write_stats(self, stage_stats, fps, frame_controller):
+        for row, stage in enumerate(self.STAGES):
+            snapshot = stage_stats[stage].snapshot()
+            self.stats[row, :] = [snapshot[field] for field in self.STAT_FIELDS]
+            _, counts, total, count = stage_stats[stage].histogram.snapshot()
+            self.histograms[row, :] = counts + [total, count]
+        self.header[3:6] = (int(fps * 1000), frame_controller.skip, int(frame_controller.scale * 1000))
+    
+    def read_stats(self):
+        stats = {}
+        for row, stage in enumerate(self.STAGES):
+            values = dict(zip(self.STAT_FIELDS, self.stats[row].tolist()))
+            values['frames'] = int(values['frames'])
+            values['dropped'] = int(values['dropped'])
+            stats[stage] = values
+        fps = int(self.header[3]) / 1000
+        skip = max(int(self.header[4]), 1)
+        stats['fps'] = round(fps, 2)
+        stats['adaptive'] = {
+            'skip': skip,
+            'scale': int(self.header[5]) / 1000,
+            'effective_fps': round(fps / skip, 2)
+        }
+        return stats
+    
+    def read_histograms(self):
+        histograms = {}
+        for row, stage in enumerate(self.STAGES):
+            values = self.histograms[row].tolist()
+            counts = [int(value) for value in values[:-2]]
+            histograms[stage] = (FRAME_BUCKETS, counts, values[-2], int(values[-1]))
+        return histograms
+    
+    def write_lines(self, lines):
+        # odd version while rows are being rewritten, like the frame slot seq
+        self.lines_state[0] += 1
+        for row, line in enumerate(lines):
+            self.lines[row, :] = (line['x1'], line['y1'], line['x2'], line['y2'],
+                                  LANES.index(line['lane']), DIRECTIONS.index(line['direction']))
+        self.lines_state[1] = len(lines)
+        self.lines_state[0] += 1
+    
+    def read_lines(self, known_version):
+        version = int(self.lines_state[0])
+        if version == known_version or version % 2:
+            return known_version, None
+        
+        rows = self.lines[:int(self.lines_state[1])].copy()
+        if int(self.lines_state[0]) != version:
+            return known_version, None
+        
+        lines = [{
+            'name': f'line{index}',
+            'lane': LANES[int(row[4])],
+            'direction': DIRECTIONS[int(row[5])],
+            'x1': row[0], 'y1': row[1], 'x2': row[2], 'y2': row[3]
+        } for index, row in enumerate(rows.tolist())]
+        return version, lines
+    
+    def close(self):
+        self.header = self.slot_meta = self.stats = self.counts = self.histograms = None
+        self.lines_state = self.lines = self.data = None
+        self.shm.close()
+
+
+class SharedMemoryVideoProcessor(VideoProcessor):
+    def __init__(self, ring, decoder_slots=None):
+        super().__init__(decoder_slots=decoder_slots)
+        self.ring = ring
+    
+    def _publish_frame(self, frame):
+        if not self.is_processing:
+            return False
+        self.ring.write(frame)
+        return True
+    
+    def _track_detections(self, detections, frame_shape):
+        tracked = super()._track_detections(detections, frame_shape)
+        self.ring.counts[:] = self.detection_totals
+        return tracked
+    
+    def _apply_counting_lines(self):
+        version, lines = self.ring.read_lines(self.applied_lines_version)
+        if lines is not None:
+            self.applied_lines_version = version
+            self.tracker.set_lines(lines)
+
+
+def run_video_worker(video_path, ring_name, stop_event, decoder_slots, process_every_n_frames, detection_mode):
+    ring = SharedFrameRing(ring_name)
+    processor = SharedMemoryVideoProcessor(ring, decoder_slots)
+    processor.PROCESS_EVERY_N_FRAMES = process_every_n_frames
+    processor.DETECTION_MODE = detection_mode
+    processor.start_processing(video_path)
+    
+    try:
+        while not stop_event.wait(0.5):
+            ring.write_stats(processor.stage_stats, processor.FPS, processor.frame_controller)
+            if not processor.is_processing:
+                break
+    finally:
+        processor.stop_processing()
+        ring.close()
+
+
+class ProcessVideoProcessor:
+    def __init__(self, decoder_slots=None):
+        self.decoder_slots = decoder_slots
+        
+        self.context = multiprocessing.get_context('spawn')
+        self.process = None
+        self.stop_event = None
+        self.ring = None
+        self.retired_rings = []
+        self.video_path = None
+        
+        self.PROCESS_EVERY_N_FRAMES = 2
+        self.RING_SLOTS = 4
+        self.FPS = 30
+        self.DETECTION_MODE = 'motion'
+        self.drained_totals = np.zeros((2, len(VEHICLE_CLASSES)), dtype=np.int64)
+        self.counting_lines = [dict(line) for line in DEFAULT_COUNTING_LINES]
+        
+        print("Process VideoProcessor initialized")
+    
+    @property
+    def is_processing(self):
+        return self.process is not None and self.process.is_alive()
+    
+    def start_processing(self, video_path):
+        if self.is_processing:
+            print("Processing already running")
+            return False
+        
+        if not video_path or not isinstance(video_path, str):
+            print("Invalid video path")
+            return False
+        
+        probe = cv2.VideoCapture(video_path)
+        if not probe.isOpened():
+            print(f"Failed to open video: {video_path}")
+            return False
+        width = int(probe.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(probe.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fps = probe.get(cv2.CAP_PROP_FPS)
+        probe.release()
+        
+        self.FPS = fps if fps and fps > 0 else 30
+        self.video_path = video_path
+        self._release_rings()
+        self.ring = SharedFrameRing(slots=self.RING_SLOTS, slot_bytes=width * height * 3)
+        self.ring.write_lines(self.counting_lines)
+        self.drained_totals = np.zeros((2, len(VEHICLE_CLASSES)), dtype=np.int64)
+        
+        self.stop_event = self.context.Event()
+        self.process = self.context.Process(
+            target=run_video_worker,
+            args=(video_path, self.ring.name, self.stop_event, self.decoder_slots,
+                  self.PROCESS_EVERY_N_FRAMES, self.DETECTION_MODE),
+            daemon=True
+        )
+        self.process.start()
+        
+        print(f"Video worker process started (pid {self.process.pid})")
+        return True
+    
+    def stop_processing(self):
+        if self.process is None:
+            return
+        
+        print("Stopping video worker process...")
+        self.stop_event.set()
+        self.process.join(timeout=2)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout=1)
+        self.process = None
+        
+        if self.ring is not None:
+            self.retired_rings.append(self.ring)
+            self.ring.shm.unlink()
+            self.ring = None
+        self._release_rings()
+        
+        print("Video worker process stopped")
+    
+    def _release_rings(self):
+        remaining = []
+        for ring in self.retired_rings:
+            try:
+                ring.close()
+            except BufferError:
+                remaining.append(ring)
+        self.retired_rings = remaining
+    
+    def get_latest_frame(self):
+        ring = self.ring
+        if ring is None:
+            return None, None
+        return ring.read_latest()
+    
+    def is_frame_intact(self, seq):
+        ring = self.ring
+        return ring is not None and ring.is_intact(seq)
+    
+    def set_counting_lines(self, lines):
+        self.counting_lines = [dict(line) for line in lines]
+        ring = self.ring
+        if ring is not None:
+            ring.write_lines(self.counting_lines)
+    
+    def drain_detection_counts(self):
+        ring = self.ring
+        if ring is None or not DETECTORS[self.DETECTION_MODE].FEEDS_COUNTERS:
+            return None
+        
+        totals = ring.counts.copy()
+        counts = detection_delta(totals, self.drained_totals)
+        self.drained_totals = totals
+        return counts
+    
+    def get_stage_histograms(self):
+        ring = self.ring
+        if ring is None:
+            return {}
+        return ring.read_histograms()
+    
+    def get_pipeline_stats(self):
+        ring = self.ring
+        if ring is None:
+            return {'mode': 'process', 'fps': round(self.FPS, 2)}
+        
+        stats = ring.read_stats()
+        stats['mode'] = 'process'
+        stats['pid'] = self.process.pid if self.process else None
+        return stats